@@ -0,0 +1,295 @@
+from typing import List, Dict, Tuple, Union, Sequence, Optional
+import numpy as np
+import pandas as pd
+from BayesNet import BayesNet
+from Factor import Factor
+
+# operation of every node of a circuit
+LEAF, MULTIPLY, ADD = 0, 1, 2
+
+
+class _CircuitBuilder:
+    """
+    Traces a variable elimination on symbolic factors, whose entries are circuit node ids instead of numbers. Every
+    multiplied or summed entry becomes a new node.
+    """
+
+    def __init__(self, n_leaves: int) -> None:
+        self.ops = [np.full(n_leaves, LEAF, dtype=np.int8)]
+        self.children = [np.zeros((n_leaves, 0), dtype=np.int64)]
+        self.depth = np.zeros(max(n_leaves, 1024), dtype=np.int64)
+        self.size = n_leaves
+
+    def add_nodes(self, op: int, children: np.ndarray) -> np.ndarray:
+        """
+        Creates one node per row of 'children' and returns their ids.
+        """
+        ids = np.arange(self.size, self.size + len(children))
+        while self.size + len(children) > len(self.depth):
+            self.depth = np.concatenate([self.depth, np.zeros_like(self.depth)])
+        self.depth[ids] = self.depth[children].max(axis=1) + 1
+
+        self.ops.append(np.full(len(children), op, dtype=np.int8))
+        self.children.append(children)
+        self.size += len(children)
+        return ids
+
+    @staticmethod
+    def expand(a: Tuple[List[str], np.ndarray], variables: List[str]) -> np.ndarray:
+        # same as Factor.expand, on node ids
+        axes = [a[0].index(v) for v in variables if v in a[0]]
+        shape = [a[1].shape[a[0].index(v)] if v in a[0] else 1 for v in variables]
+        return a[1].transpose(axes).reshape(shape)
+
+    def multiply(self, a: Tuple[List[str], np.ndarray],
+                 b: Tuple[List[str], np.ndarray]) -> Tuple[List[str], np.ndarray]:
+        variables = a[0] + [v for v in b[0] if v not in a[0]]
+        left, right = np.broadcast_arrays(self.expand(a, variables), self.expand(b, variables))
+        ids = self.add_nodes(MULTIPLY, np.stack([left.ravel(), right.ravel()], axis=1))
+        return variables, ids.reshape(left.shape)
+
+    def sum_out(self, a: Tuple[List[str], np.ndarray], variable: str) -> Tuple[List[str], np.ndarray]:
+        axis = a[0].index(variable)
+        moved = np.moveaxis(a[1], axis, -1)
+        ids = self.add_nodes(ADD, moved.reshape(-1, moved.shape[-1]))
+        return [v for v in a[0] if v != variable], ids.reshape(moved.shape[:-1])
+
+
+class ArithmeticCircuit:
+    """
+    Arithmetic circuit of a BayesNet: the network polynomial, the sum over all instantiations of the product of
+    their CPT entries and evidence indicators, in factored form. The circuit is compiled once by tracing a variable
+    elimination and stored as flat arrays in topological order, so that evaluating it for new evidence is a fixed
+    sequence of vectorized gathers and reductions:
+        - the forward pass computes Pr(e) at the root,
+        - the backward pass computes the derivative of the root to every indicator, which is Pr(x, e - X) for every
+          value x of every variable X, so all posterior marginals come from one pass.
+    Both passes take a batch of evidence rows at once.
+    """
+
+    def __init__(self, variables: List[str], cardinalities: Sequence[int], parameters: np.ndarray, ops: np.ndarray,
+                 child_offsets: np.ndarray, children: np.ndarray, depth: np.ndarray,
+                 states: Optional[List[List[str]]] = None) -> None:
+        """
+        :param variables: Variables of the network.
+        :param cardinalities: Number of states of every variable. The indicators of the states of variable i are
+            the nodes from self.offsets[i] on, which follow the parameter leaves.
+        :param parameters: Values of the parameter leaves, nodes 0 to len(parameters).
+        :param ops: Operation of every node (LEAF, MULTIPLY or ADD), sorted by depth and then by operation.
+        :param child_offsets: The children of node i are children[child_offsets[i]:child_offsets[i + 1]].
+        :param children: Child node ids, all smaller than the id of their parent.
+        :param depth: Length of the longest path from every node to a leaf.
+        :param states: Names of the states of every variable, by default 'False' and 'True' for binary variables
+            and '0', '1', ... otherwise.
+        """
+        self.variables = list(variables)
+        self.index = {v: i for i, v in enumerate(self.variables)}
+        self.cardinalities = np.asarray(cardinalities, dtype=np.int64)
+        self.parameters = np.asarray(parameters, dtype=np.float64)
+        self.ops = np.asarray(ops, dtype=np.int8)
+        self.child_offsets = np.asarray(child_offsets, dtype=np.int64)
+        self.children = np.asarray(children, dtype=np.int64)
+        self.depth = np.asarray(depth, dtype=np.int64)
+        self.states = [list(names) for names in states] if states is not None else [
+            ['False', 'True'] if n == 2 else [str(i) for i in range(n)] for n in self.cardinalities]
+        self.root = len(self.ops) - 1
+        self.offsets = len(self.parameters) + np.concatenate([[0], np.cumsum(self.cardinalities)])
+        self.n_leaves = int(self.offsets[-1])
+
+        # the internal nodes fall apart into blocks of one depth and operation, every block is one vectorized step
+        boundaries = np.flatnonzero((np.diff(self.depth) != 0) | (np.diff(self.ops) != 0)) + 1
+        self.blocks = []
+        for start, end in zip(np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(self.ops)]])):
+            if start < self.n_leaves:
+                continue
+            first = self.child_offsets[start]
+            self.blocks.append((start, end, self.ops[start], self.children[first:self.child_offsets[end]],
+                                self.child_offsets[start:end] - first))
+
+    @classmethod
+    def compile(cls, bn: BayesNet, order: List[str]) -> 'ArithmeticCircuit':
+        """
+        Compiles the network by variable elimination along the given order: every CPT entry and every indicator
+        becomes a leaf, and every entry of every intermediate factor a multiply or add node.
+
+        :param bn: The network to compile.
+        :param order: Elimination order of all variables.
+        :return: The compiled circuit.
+        """
+        variables = bn.get_all_variables()
+        cardinalities = [bn.get_cardinality(v) for v in variables]
+        cpts = [bn.get_factor(v) for v in variables]
+        parameters = np.concatenate([f.values.ravel() for f in cpts])
+        builder = _CircuitBuilder(len(parameters) + sum(cardinalities))
+
+        # symbolic CPTs hold the ids of their parameter leaves, every variable gets a factor of its indicators
+        factors = []
+        offset = 0
+        for cpt in cpts:
+            factors.append((cpt.variables, np.arange(offset, offset + cpt.values.size).reshape(cpt.values.shape)))
+            offset += cpt.values.size
+        for v, cardinality in zip(variables, cardinalities):
+            factors.append(([v], np.arange(offset, offset + cardinality)))
+            offset += cardinality
+
+        for variable in order:
+            inputs = [f for f in factors if variable in f[0]]
+            factors = [f for f in factors if variable not in f[0]]
+            product = inputs[0]
+            for factor in inputs[1:]:
+                product = builder.multiply(product, factor)
+            factors.append(builder.sum_out(product, variable))
+
+        root = factors[0]
+        for factor in factors[1:]:
+            root = builder.multiply(root, factor)
+
+        # topological order: by depth, and within a depth by operation; the root goes last, one level up
+        ops = np.concatenate(builder.ops)
+        depth = builder.depth[:builder.size].copy()
+        depth[root[1].item()] = depth.max() + 1
+        permutation = np.lexsort((ops, depth))
+        relabel = np.empty_like(permutation)
+        relabel[permutation] = np.arange(len(permutation))
+
+        # gather the children of every node in the new order
+        counts = np.concatenate([np.full(len(c), c.shape[1], dtype=np.int64) for c in builder.children])
+        flat = np.concatenate([c.ravel() for c in builder.children])
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        child_offsets = np.concatenate([[0], np.cumsum(counts[permutation])])
+        positions = np.repeat(starts[permutation] - child_offsets[:-1], counts[permutation]) + np.arange(len(flat))
+
+        return cls(variables, cardinalities, parameters, ops[permutation], child_offsets, relabel[flat[positions]],
+                   depth[permutation], [bn.get_states(v) for v in variables])
+
+    # EVALUATION -------------------------------------------------------------------------------------------------------
+
+    def indicators(self, evidence: Union[pd.Series, pd.DataFrame]) -> np.ndarray:
+        """
+        Returns the indicator values for one instantiation (Series) or every row of evidence (DataFrame) as an
+        array of shape (indicators, rows): 0 for the states that contradict the evidence, 1 otherwise. Values are
+        state indices or names, others raise a ValueError (see BayesNet.encode_state).
+        """
+        variables = evidence.index if isinstance(evidence, pd.Series) else evidence.columns
+        unknown = [v for v in variables if v not in self.index]
+        if unknown:
+            raise ValueError('Evidence on unknown variables {}.'.format(unknown))
+
+        # indicators are numbered from 0 here, the leaves before them are the parameters
+        offsets = self.offsets - len(self.parameters)
+
+        # a single instantiation skips the DataFrame, which costs more than the circuit of a small network
+        if isinstance(evidence, pd.Series):
+            indicators = np.ones((self.n_leaves - len(self.parameters), 1))
+            for variable, value in evidence.items():
+                i = self.index[variable]
+                indicators[offsets[i]:offsets[i + 1]] = 0.0
+                indicators[offsets[i] + int(BayesNet.encode_state(variable, value, self.states[i]))] = 1.0
+            return indicators
+
+        indicators = np.ones((self.n_leaves - len(self.parameters), len(evidence)))
+        rows = np.arange(len(evidence))
+        for variable in evidence.columns:
+            i = self.index[variable]
+            indicators[offsets[i]:offsets[i + 1]] = 0.0
+            states = BayesNet.encode_column(variable, evidence[variable], self.states[i])
+            indicators[offsets[i] + states.to_numpy().astype(int), rows] = 1.0
+        return indicators
+
+    def forward(self, indicators: np.ndarray) -> np.ndarray:
+        """
+        Evaluates every node for every evidence row.
+
+        :param indicators: Indicator values as returned by self.indicators.
+        :return: The node values as an array of shape (nodes, rows).
+        """
+        values = np.empty((len(self.ops), indicators.shape[1]))
+        values[:len(self.parameters)] = self.parameters[:, None]
+        values[len(self.parameters):self.n_leaves] = indicators
+        for start, end, op, children, offsets in self.blocks:
+            reduce = np.multiply if op == MULTIPLY else np.add
+            values[start:end] = reduce.reduceat(values[children], offsets, axis=0)
+        return values
+
+    def backward(self, values: np.ndarray) -> np.ndarray:
+        """
+        Computes the derivative of the root to every node by reverse-mode differentiation, from the node values of
+        the forward pass. Multiply nodes have two children, so the derivative to one child is the parent's derivative
+        times the other child, which also holds when some values are 0.
+
+        :return: The derivatives as an array of shape (nodes, rows).
+        """
+        derivatives = np.zeros_like(values)
+        derivatives[self.root] = 1.0
+        for start, end, op, children, offsets in reversed(self.blocks):
+            if op == MULTIPLY:
+                siblings = children.reshape(-1, 2)[:, ::-1].ravel()
+                contributions = np.repeat(derivatives[start:end], 2, axis=0) * values[siblings]
+            else:
+                counts = np.diff(np.append(offsets, len(children)))
+                contributions = np.repeat(derivatives[start:end], counts, axis=0)
+            np.add.at(derivatives, children, contributions)
+        return derivatives
+
+    # QUERIES ----------------------------------------------------------------------------------------------------------
+
+    def batch_probability_of_evidence(self, evidence: pd.DataFrame) -> np.ndarray:
+        """
+        Computes Pr(e) for every row of evidence with one forward pass.
+        """
+        return self.forward(self.indicators(evidence))[self.root].copy()
+
+    def probability_of_evidence(self, evidence: pd.Series) -> float:
+        """
+        Computes Pr(e) with one forward pass.
+        """
+        return float(self.forward(self.indicators(evidence))[self.root, 0])
+
+    def batch_marginals(self, evidence: Union[pd.Series, pd.DataFrame]) -> Dict[str, np.ndarray]:
+        """
+        Computes the posterior marginal of every variable for every row of evidence with one forward and one
+        backward pass: Pr(x | e) is the indicator of x times the derivative to it, divided by Pr(e).
+
+        :return: Per variable an array of shape (rows, number of states).
+        """
+        values = self.forward(self.indicators(evidence))
+        derivatives = self.backward(values)
+        leaves = slice(len(self.parameters), self.n_leaves)
+        posteriors = (values[leaves] * derivatives[leaves] / values[self.root]).T
+        offsets = self.offsets - len(self.parameters)
+        return {v: posteriors[:, offsets[i]:offsets[i + 1]] for i, v in enumerate(self.variables)}
+
+    def marginals(self, evidence: pd.Series) -> Dict[str, Factor]:
+        """
+        Computes the posterior marginal of every variable with one forward and one backward pass.
+        """
+        return {v: Factor([v], posteriors[0]) for v, posteriors in self.batch_marginals(evidence).items()}
+
+    # SERIALIZATION ----------------------------------------------------------------------------------------------------
+
+    def save(self, file_path: str) -> None:
+        """
+        Writes the circuit to a .npz file.
+        """
+        np.savez_compressed(file_path, variables=np.array(self.variables, dtype=str),
+                            cardinalities=self.cardinalities, parameters=self.parameters, ops=self.ops,
+                            child_offsets=self.child_offsets, children=self.children, depth=self.depth,
+                            state_names=np.array([name for names in self.states for name in names], dtype=str))
+
+    @classmethod
+    def load(cls, file_path: str) -> 'ArithmeticCircuit':
+        """
+        Reads a circuit written by save.
+        """
+        with np.load(file_path) as data:
+            # circuits saved before the state names were kept get the default names
+            states = None
+            if 'state_names' in data:
+                names = [str(name) for name in data['state_names']]
+                offsets = np.concatenate([[0], np.cumsum(data['cardinalities'])])
+                states = [names[offsets[i]:offsets[i + 1]] for i in range(len(data['cardinalities']))]
+            return cls([str(v) for v in data['variables']], data['cardinalities'], data['parameters'], data['ops'],
+                       data['child_offsets'], data['children'], data['depth'], states)
+
+    def __len__(self) -> int:
+        return len(self.ops)
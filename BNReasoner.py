@@ -5,24 +5,83 @@
 # Description: This file contains the BNReasoner class, which is used to perform inference on a
 ####################################################################################################
 
-from typing import Union, List
+from typing import Union, List, Dict, Set, Tuple, Optional
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from BayesNet import BayesNet
-from heuristics import min_degree, min_fill
+from heuristics import HEURISTICS, greedy_order, search_order, order_cost
+from OrderStore import OrderStore
+from Factor import Factor
+from QueryPlan import QueryPlan, PlanCache, MemoryBudgetError, BATCH
+from JunctionTree import JunctionTree
+from RecursiveConditioning import RecursiveConditioning
+from ArithmeticCircuit import ArithmeticCircuit
+from KBestFactor import KBestFactor
+from Sampler import Sampler
+from Tracer import Tracer
 import pandas as pd
+import numpy as np
 import networkx as nx
-from copy import deepcopy
 import pandas as pd
 
 class BNReasoner():
 
     def __init__(self,
                  order_method: str = 'min', #'min' or 'fill'
-                 net: Union[str, BayesNet] = 'testing/lecture_example2.BIFXML'):
+                 net: Union[str, BayesNet] = 'testing/lecture_example2.BIFXML',
+                 plan_cache_size: int = 128,
+                 engine: str = 've', #'ve', 'jt', 'rc', 'logic', 'lw' or 'gibbs'
+                 order_time_budget: float = 0.0,
+                 order_store: Optional[str] = None,
+                 n_samples: int = 10000,
+                 seed: Optional[int] = None,
+                 threads: int = 1,
+                 sparse_threshold: float = 0.0,
+                 scaled: bool = False,
+                 trace: bool = False,
+                 memory_budget: Optional[int] = None,
+                 on_budget: str = 'raise', #'raise', 'condition', 'recursive' or 'approximate'
+                 max_cutset: int = 16,
+                 rc_cache_size: Optional[int] = None):
         """
         :param net: either file path of the bayesian network in BIFXML format or BayesNet object
         :param method: the ordering method to use for variable elimination:
             'min' for using the min-degree heuristic
             'fill' for using the fill-in heuristic
+            'weighted-fill' for using the fill-in heuristic weighted by the cardinalities
+            'weight' for using the min-weight heuristic
+        :param plan_cache_size: number of compiled query plans to keep, 0 disables the cache
+        :param engine: the inference engine for posterior marginals:
+            've' for variable elimination per query
+            'jt' for a junction tree calibrated once per evidence set
+            'rc' for recursive conditioning on a dtree, in any space between linear and elimination-level
+            'logic', 'lw' or 'gibbs' for approximate inference by logic sampling, likelihood weighting or Gibbs
+            sampling
+        :param order_time_budget: seconds to spend per ordering on searching for an order with a smaller total
+            factor size than the heuristic gives, 0 to use the heuristic only
+        :param order_store: path of a JSON file in which the best orders found are kept per network and set of
+            eliminated variables, and from which later reasoners load them
+        :param n_samples: number of samples drawn per query by the sampling engines
+        :param seed: seed of the sampling engines, for reproducible estimates
+        :param threads: number of threads on which independent branches of a variable elimination run
+            concurrently, 1 to eliminate sequentially
+        :param sparse_threshold: factors of a variable elimination with at most this fraction of nonzero entries
+            are stored sparsely, e.g. deterministic CPTs or factors zeroed by evidence; 0 keeps all factors dense
+        :param scaled: if True every factor of variable elimination and MAP is rescaled to a maximum of 1 with its
+            scale kept as a logarithm, so that products of many small probabilities do not underflow
+        :param trace: if True every query is instrumented and recorded in self.tracer
+        :param memory_budget: largest factor, in bytes, a variable elimination may build; the factor sizes are
+            computed from the plan before running it. None for no limit
+        :param on_budget: what to do with a query whose plan exceeds the memory budget:
+            'raise' for raising a MemoryBudgetError naming the variables of the offending factor
+            'condition' for cutset conditioning: eliminating once per instantiation of a few variables of the
+            offending factor, which trades time for memory
+            'recursive' for recursive conditioning with a cache of rc_cache_size results
+            'approximate' for estimating posteriors with likelihood weighting
+        :param max_cutset: the largest number of variables cutset conditioning may condition on
+        :param rc_cache_size: number of results recursive conditioning may cache, 0 for linear space. None caches
+            one result of 8 bytes per memory_budget byte over 8, or everything without a memory budget
         """
         if type(net) == str:
             # constructs a BN object
@@ -36,17 +95,59 @@ class BNReasoner():
         # the ordering method to use for variable elimination
         self.order_method = order_method
 
+        # compiled variable elimination plans per (query, evidence variables) signature
+        self.plan_cache = PlanCache(plan_cache_size)
+
+        # the inference engine, the junction tree is built on first use
+        if engine not in ('ve', 'jt', 'rc') + Sampler.METHODS:
+            raise ValueError('Unknown engine {}.'.format(engine))
+        self.engine = engine
+        self._junction_tree = None
+        self._recursive_conditioning = None
+
+        # anytime ordering search and persisted orders
+        self.order_time_budget = order_time_budget
+        self.order_store = OrderStore(order_store) if order_store is not None else None
+        self._searched_orders = {}
+
+        # the sampler is built on first use of an approximate engine
+        self.n_samples = n_samples
+        self.seed = seed
+        self._sampler = None
+
+        # thread pool for intra-query parallelism, shared by all queries of this reasoner
+        self.executor = ThreadPoolExecutor(threads) if threads > 1 else None
+
+        # density below which factors are stored sparsely
+        self.sparse_threshold = sparse_threshold
+
+        # underflow-safe arithmetic with scaled factors
+        self.scaled = scaled
+
+        # opt-in instrumentation of the queries
+        self.tracer = Tracer() if trace else None
+
+        # bound on the size of the factors of variable elimination
+        if on_budget not in ('raise', 'condition', 'recursive', 'approximate'):
+            raise ValueError('Unknown budget fallback {}.'.format(on_budget))
+        self.memory_budget = memory_budget
+        self.on_budget = on_budget
+        self.max_cutset = max_cutset
+        if rc_cache_size is None and memory_budget is not None:
+            rc_cache_size = memory_budget // 8
+        self.rc_cache_size = rc_cache_size
+
 
 # --------------------------------- INDEPENDENCE DETERMINATION --------------------------------- #
 
-    def prune(self, query: List[str], evidence: pd.Series) -> bool:
+    def prune(self, query: List[str], evidence: pd.Series) -> BayesNet:
             """
-            Given a set of query variables Q and evidence e, node- and edge-prune the Bayesian network
+            Given a set of query variables Q and evidence e, node- and edge-prune the Bayesian network.
+            The pruned network is a view that shares the unchanged structure and CPTs with self.bn.
             """
-            keep_node_pruning = True
-
-            # create a copy of the structure
-            bn = deepcopy(self.bn)
+            evidence = self.bn.encode_instantiation(evidence)
+            # create a view on the structure
+            bn = self.bn.view()
 
             # 1: edge-prune: delete the outgoing edges of every node that is in the evidence
             for node in evidence.index:
@@ -59,44 +160,96 @@ class BNReasoner():
                     bn.update_cpt(child, reduced_cpt)
 
             # 2: node-prune: delete any leaf node that doesn’t appear in query or evidence
-            to_keep = query + evidence.index.tolist()
+            to_keep = set(query + evidence.index.tolist())
 
-            # keep pruning until no nodes can be deleted
-            while keep_node_pruning:
+            # keep pruning until no nodes can be deleted: deleting a leaf can turn its parents into leaves
+            leaves = [node for node in bn.get_all_variables() if node not in to_keep and not bn.get_children(node)]
+            while leaves:
+                node = leaves.pop()
+                parents = list(bn.structure.predecessors(node))
+                bn.del_var(node)
 
-                for node in bn.get_all_variables():
+                for parent in parents:
+                    if parent not in to_keep and not bn.get_children(parent):
+                        leaves.append(parent)
 
-                    # prune leaf node
-                    if node not in to_keep and not bn.get_children(node):
-                        bn.del_var(node)
+            return bn
 
-                    # stop pruning
-                    else:
-                        keep_node_pruning = False
 
-            return bn
+    def reachable(self, X: List[str], Z: List[str]) -> Set[str]:
+        """
+        Given two sets of variables X and Z, return all variables that are connected to X by an active trail
+        given Z (Bayes-ball / reachable algorithm). Only uses the structure of the BN and runs in O(V+E).
+        """
+        structure = self.bn.structure
+        Z = set(Z)
+
+        # phase 1: Z and its ancestors, the nodes through which a v-structure is active
+        ancestors = set()
+        to_visit = list(Z)
+        while to_visit:
+            node = to_visit.pop()
+            if node not in ancestors:
+                ancestors.add(node)
+                to_visit.extend(structure.predecessors(node))
+
+        # phase 2: traverse active trails, 'up' when arriving from a child, 'down' when arriving from a parent
+        reachable = set()
+        visited = set()
+        to_visit = [(x, 'up') for x in X]
+        while to_visit:
+            node, direction = to_visit.pop()
+            if (node, direction) in visited:
+                continue
+            visited.add((node, direction))
+
+            if node not in Z:
+                reachable.add(node)
+
+            if direction == 'up' and node not in Z:
+                to_visit.extend((parent, 'up') for parent in structure.predecessors(node))
+                to_visit.extend((child, 'down') for child in structure.successors(node))
+            elif direction == 'down':
+                if node not in Z:
+                    to_visit.extend((child, 'down') for child in structure.successors(node))
+                if node in ancestors:
+                    to_visit.extend((parent, 'up') for parent in structure.predecessors(node))
+
+        return reachable
+
+
+    def d_separated(self, X: List[str], Z: List[str]) -> Set[str]:
+        """
+        Given two sets of variables X and Z, return all variables that are d-separated from X given Z.
+        """
+        reachable = self.reachable(X, Z)
+        return {v for v in self.bn.get_all_variables() if v not in reachable and v not in Z}
 
 
     def d_separation(self, X: List[str], Y: List[str], Z: List[str]) -> bool:
         """
         Given three sets of variables X, Y, and Z,
-        determine whether X is d-separated of Y given Z (evidence) through pruning
+        determine whether X is d-separated of Y given Z (evidence) by checking that no variable in Y
+        is reachable from X given Z
         """
-        # convert Z to evidence pd series
-        Z = pd.Series({z: True for z in Z})
+        reachable = self.reachable(X, Z)
+        return not any(y in reachable for y in Y)
 
-        bn = self.prune(query=X+Y, evidence=Z)                                                                  # TODO: eigenlijk mag dit buiten de functie en moet dit in de main? want neem aan dat we dit ook voor andere functies nodig hebben
 
-        # convert directed graph to undirected graph
-        undirected = bn.structure.to_undirected()
-
-        # if there is a path from X to Y, then X is not d-separated from Y given Z
-        for x in X:
-            for y in Y:
-                if nx.has_path(undirected, x, y):
-                    return False
+    def d_separation_batch(self, triples: List[Tuple[List[str], List[str], List[str]]]) -> List[bool]:
+        """
+        Given a list of (X, Y, Z) triples, determine for each whether X is d-separated of Y given Z.
+        The reachable set is computed once per distinct (X, Z) pair.
+        """
+        reachable_sets = {}
+        result = []
+        for X, Y, Z in triples:
+            key = (frozenset(X), frozenset(Z))
+            if key not in reachable_sets:
+                reachable_sets[key] = self.reachable(X, Z)
+            result.append(not any(y in reachable_sets[key] for y in Y))
 
-        return True
+        return result
 
 
     def independence(self, X: List[str], Y: List[str], Z: List[str]) -> bool:
@@ -162,49 +315,60 @@ class BNReasoner():
         Given a set of variables X in the Bayesian network,
         compute a good ordering for the elimination of X
         """
+        order, _, _ = self.order_with_stats(variables)
+        return order
 
-        self.order_method = 'min'                                           # TODO: for some reason does not work as class attribute if this line is left out
-        order = [] # list of nodes in order of elimination
-        interaction_graph = self.bn.get_interaction_graph()
-
-        variables_copy = variables.copy()
-
-        # elliminate node by node until all nodes are eliminated
-        for node in variables_copy:
-
-            # determine wich node to elliminate next                        # TODO: implement other methods?
-            if self.order_method == 'min':
-                chosen_node = min_degree(interaction_graph, variables)
-
-            if self.order_method == 'fill':
-                chosen_node = min_fill(interaction_graph, variables)
 
-            order.append(chosen_node)
-            variables.remove(chosen_node)
+    def order_with_stats(self, variables: List[str]) -> Tuple[List[str], int, int]:
+        """
+        Given a set of variables X in the Bayesian network, compute an elimination ordering for X with the
+        heuristic in self.order_method ('min', 'fill', 'weighted-fill' or 'weight'), falling back to
+        min-degree for unknown methods.
+        return: the ordering, its induced width and the predicted size (in cells) of the largest factor
+        """
+        method = self.order_method if self.order_method in HEURISTICS else 'min'
+        interaction_graph = self.bn.get_interaction_graph()
+        cardinalities = {v: self.bn.get_cardinality(v) for v in interaction_graph.nodes}
 
-            # find direct neigbour nodes
-            neighbours = list(interaction_graph.neighbors(chosen_node))
-            other_neighbours = [n for n in neighbours]
+        if self.order_time_budget <= 0 and self.order_store is None:
+            return greedy_order(interaction_graph, list(variables), method, cardinalities)
 
-            # create new neighbourhood for each neighbour
-            for neighbour in neighbours:
+        # use the order searched before by this reasoner or the stored one, or search for one within the time
+        # budget and store it
+        key = OrderStore.key(self.bn.fingerprint(), variables)
+        order = self._searched_orders.get(key)
+        if order is None and self.order_store is not None:
+            order = self.order_store.get(key)
+        if order is None:
+            initial = greedy_order(interaction_graph, list(variables), method, cardinalities)[0]
+            order, cost = search_order(interaction_graph, list(variables), self.order_time_budget, cardinalities,
+                                       initial=initial)
+            if self.order_store is not None:
+                self.order_store.put(key, order, cost)
+        self._searched_orders[key] = order
 
-                # skip when no other neighbours
-                if len(other_neighbours) > 1:
+        _, induced_width, max_factor_size = order_cost(interaction_graph, order, cardinalities)
+        return list(order), induced_width, max_factor_size
 
-                    # prevent neigbour from connecting to itself
-                    other_neighbours.remove(str(neighbour))
 
-                    # fill in missing edges between neighbours in neighbourhood
-                    for n in other_neighbours:
+    # --------------------------------- INSTRUMENTATION --------------------------------- #
 
-                        if not interaction_graph.has_edge(n, neighbour):
-                            interaction_graph.add_edge(neighbour, n)
+    def trace_query(self, kind: str, query: List[str], evidence_vars: List[str]):
+        """
+        Context in which the operations of one query are recorded by the tracer, a no-op when tracing is off.
+        """
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.query(kind, query, list(evidence_vars))
 
-            # remove current node and edges
-            interaction_graph.remove_node(chosen_node)
 
-        return order
+    def trace_operation(self, name: str):
+        """
+        Context that times one operation of the current query, a no-op when tracing is off.
+        """
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.operation(name)
 
 
     # --------------------------------- BAYES PROBABILITY FUNCTIONS --------------------------------- #
@@ -215,106 +379,420 @@ class BNReasoner():
         compute the CPT of X given the evidence.
         return: prior marginal
         """
-        # get ancestors of the query variable
+        return self.joint_factor(query, evidence).to_dataframe()
+
+
+    def joint_factor(self, query: List[str], evidence: pd.Series = pd.Series()) -> Factor:
+        """
+        Variable elimination on dense factors: compute the factor Pr(Q ^ e) over the query variables.
+        Evidence on variables outside the query is sliced out of the factors, evidence on query variables
+        sets the incompatible instantiations to zero.
+        return: prior marginal as a Factor
+        """
+        evidence = self.bn.encode_instantiation(evidence)
+        with self.trace_query('joint', query, evidence.index):
+            return self.bounded_joint(query, evidence)
+
+
+    def bounded_joint(self, query: List[str], evidence: pd.Series, normalized: bool = False) -> Factor:
+        """
+        Compute Pr(Q ^ e) within the memory budget: the plan is run as is if its largest factor fits, otherwise
+        the query is answered by cutset or recursive conditioning or refused, depending on self.on_budget.
+        :param normalized: if True only the components that matter for Pr(Q | e) are eliminated
+        """
+        plan = self.compile_plan(query, evidence.index.tolist(), normalized)
+        if self.fits_budget(plan):
+            return self.execute_plan(plan, evidence)
+        if self.on_budget == 'condition':
+            return self.conditioned_joint(query, evidence)
+        if self.on_budget == 'recursive':
+            with self.trace_operation('recursive'):
+                return self.recursive_conditioning().joint(query, evidence)
+        raise MemoryBudgetError(plan.widest, plan.peak_cells, self.memory_budget)
+
+
+    def fits_budget(self, plan: QueryPlan, rows: int = 1) -> bool:
+        """
+        Determine whether the largest factor of the plan, for the given number of evidence rows, fits in the
+        memory budget.
+        """
+        return self.memory_budget is None or plan.peak_cells * rows * 8 <= self.memory_budget
+
+
+    def conditioned_joint(self, query: List[str], evidence: pd.Series) -> Factor:
+        """
+        Cutset conditioning: Pr(Q ^ e) = sum over c of Pr(Q ^ e ^ c). The cutset is grown one variable at a time,
+        taking the variable of the largest factor with the most neighbours in the interaction graph, until
+        eliminating with the cutset as extra evidence fits in the memory budget.
+        """
         interaction_graph = self.bn.get_interaction_graph()
-        ancestors_sets = [nx.ancestors(interaction_graph, node) for node in query]
-        intersection_set = set.union(*ancestors_sets)
-        ancestors = list(intersection_set)
+        cutset = []
+        plan = self.compile_plan(query, evidence.index.tolist())
+        while not self.fits_budget(plan):
+            candidates = [v for v in plan.widest if v not in query and v not in evidence.index]
+            if not candidates or len(cutset) >= self.max_cutset:
+                raise MemoryBudgetError(plan.widest, plan.peak_cells, self.memory_budget)
+            cutset.append(max(candidates, key=interaction_graph.degree))
+            plan = self.compile_plan(query, evidence.index.tolist() + cutset)
+
+        # the joints of the instantiations of the cutset may have different scales
+        joints = []
+        with self.trace_operation('condition'):
+            for values in itertools.product(*[range(self.bn.get_cardinality(v)) for v in cutset]):
+                instantiation = pd.concat([evidence, pd.Series(dict(zip(cutset, values)), dtype=object)])
+                joints.append(self.execute_plan(plan, instantiation))
+        log_scale = max(joint.log_scale for joint in joints)
+        values = sum(joint.values * np.exp(joint.log_scale - log_scale) for joint in joints)
+        return Factor(query, values, log_scale)
+
+
+    def execute_plan(self, plan: QueryPlan, evidence: pd.Series) -> Factor:
+        """
+        Runs a compiled plan with the executor, factor representation, arithmetic and tracer of this reasoner.
+        """
+        return plan.execute(self.bn, evidence, self.executor, self.sparse_threshold, self.scaled, self.tracer)
 
-        # remove query from collective ancestors
-        ancestors = [ancestor for ancestor in ancestors if not ancestor in query]
 
-        # get the order of elimination
-        order = self.find_order(ancestors)
+    def compile_plan(self, query: List[str], evidence_vars: List[str], normalized: bool = False) -> QueryPlan:
+        """
+        Given the query variables and the names of the evidence variables, return the variable elimination plan
+        (pruned variable set, elimination order and multiply/sum-out schedule), from the plan cache if possible.
+        The cache is not invalidated automatically: call self.plan_cache.clear() after changing the structure.
+        :param normalized: if True the plan is only used for Pr(Q | e) and leaves out the components that are
+            d-separated from the query by the evidence, which only scale Pr(Q ^ e) by a constant
+        """
+        key = QueryPlan.signature(query, evidence_vars) + (normalized,)
+        plan = self.plan_cache.get(key)
+        if self.tracer is not None:
+            self.tracer.plan_cache(plan is not None)
+        if plan is not None:
+            if self.tracer is not None:
+                self.tracer.order(plan.order)
+            return plan
+
+        with self.trace_operation('relevance'):
+            components, avoided = self.relevance(query, evidence_vars, normalized)
+
+        # order every independent component on its own, the query is never eliminated
+        order = []
+        with self.trace_operation('order'):
+            for component in components:
+                order += self.find_order([v for v in component if v not in query])
+        if self.tracer is not None:
+            self.tracer.order(order)
+
+        # the factors of ancestors and query in the BN
+        variables = [v for component in components for v in component]
+        scopes = [self.bn.get_factor(variable).variables for variable in variables]
+        cardinalities = {v: self.bn.get_cardinality(v) for scope in scopes for v in scope}
+
+        plan = QueryPlan(query, evidence_vars, variables, order, scopes, cardinalities)
+        plan.avoided = avoided
+        self.plan_cache.put(key, plan)
+        return plan
+
+
+    def relevance(self, query: List[str], evidence_vars: List[str],
+                  normalized: bool = False) -> Tuple[List[List[str]], Dict[str, int]]:
+        """
+        Query-relevance preprocessing. Only the ancestors of the query and the evidence in the DAG are relevant,
+        all other variables are barren and sum out to 1. The CPTs of the relevant variables, with the evidence
+        outside the query sliced out, fall apart into independent components that are eliminated separately.
+        return: the variables whose CPTs take part in the elimination, grouped per component, and the number of
+            factors and variables of the network the query avoids
+        """
+        relevant = set(query) | set(evidence_vars)
+        for variable in list(relevant):
+            relevant |= nx.ancestors(self.bn.structure, variable)
+        relevant = [v for v in self.bn.get_all_variables() if v in relevant]
+
+        # connect the variables of every CPT that remain after slicing the evidence
+        sliced = set(evidence_vars) - set(query)
+        graph = nx.Graph()
+        graph.add_nodes_from(relevant)
+        for variable in relevant:
+            scope = [v for v in self.bn.get_scope(variable) if v not in sliced]
+            graph.add_edges_from(zip(scope, scope[1:]))
+
+        # every CPT belongs to the component of its remaining scope, fully sliced CPTs are constants
+        component_of = {}
+        for i, nodes in enumerate(nx.connected_components(graph)):
+            component_of.update((v, i) for v in nodes)
+        components = {}
+        for variable in relevant:
+            scope = [v for v in self.bn.get_scope(variable) if v not in sliced]
+            components.setdefault(component_of[scope[0]] if scope else None, []).append(variable)
+
+        # components without a query variable are d-separated from the query by the evidence
+        if normalized:
+            query_components = {component_of[q] for q in query}
+            components = {i: c for i, c in components.items() if i in query_components}
+        components = list(components.values())
+
+        used = [v for component in components for v in component]
+        mentioned = {u for v in used for u in self.bn.get_scope(v)}
+        avoided = {'factors': len(self.bn.get_all_variables()) - len(used),
+                   'variables': len(self.bn.get_all_variables()) - len(mentioned)}
+        return components, avoided
 
-        # make a list of all cpts of ancestors and query in the BN
-        all_variables = order + query
-        cpt_list = []
 
-        for variable in all_variables:
-            cpt = self.bn.get_cpt(variable)
+    def marginal_distributions(self, query: List[str], evidence: pd.Series) -> pd.DataFrame:
+        """
+        Sum out a set of variables by using variable elimination.
+        return: posterior marginal
+        """
+        return self.posterior_factor(query, evidence).to_dataframe()
 
-            # in case of evidence, remove incompatible rows from cpt
-            if not evidence.empty:
-                cpt = self.bn.get_compatible_instantiations_table(evidence, cpt)
 
-            cpt_list.append(cpt)
+    def posterior_factor(self, query: List[str], evidence: pd.Series) -> Factor:
+        """
+        Same as marginal_distributions, but returns the posterior marginal as a Factor. Evidence values are state
+        indices (booleans for binary variables) or state names; others raise a ValueError.
+        """
+        evidence = self.bn.encode_instantiation(evidence)
+        with self.trace_query('posterior', query, evidence.index):
+            # with the junction tree engine, queries within one clique are read off the calibrated tree
+            if self.engine == 'jt':
+                junction_tree = self.junction_tree()
+                if junction_tree.find_clique(query) is not None:
+                    junction_tree.calibrate(evidence)
+                    return junction_tree.marginal(query)
+
+            if self.engine == 'rc':
+                with self.trace_operation('recursive'):
+                    return self.recursive_conditioning().joint(query, evidence).normalize()
+
+            if self.engine in Sampler.METHODS:
+                return self.sampler().estimate(query, evidence, self.engine, self.n_samples)[0]
+
+            # Pr(Q | e) = Pr(Q ^ e) / Pr(e), where Pr(e) is the sum of Pr(Q ^ e) over Q; the components that are
+            # d-separated from the query only scale Pr(Q ^ e) and are left out
+            try:
+                return self.bounded_joint(query, evidence, normalized=True).normalize()
+            except MemoryBudgetError:
+                if self.on_budget != 'approximate':
+                    raise
+                return self.sampler().estimate(query, evidence, 'lw', self.n_samples)[0]
+
+
+    def posterior_with_evidence(self, query: List[str], evidence: pd.Series) -> Tuple[Factor, float]:
+        """
+        Compute the posterior marginal of the query and Pr(e) from one variable elimination: Pr(e) is the sum of
+        Pr(Q ^ e) over Q.
+        return: the posterior marginal as a Factor and Pr(e)
+        """
+        joint = self.joint_factor(query, evidence)
+        return joint.normalize(), float(np.exp(joint.log_total()))
 
-        # marginalize for every ancestor
-        for ancestor in order:
-            # get cpts for the variable and its ancestors
-            tables_ancestors = [table for table in cpt_list if ancestor in table.columns]
-            tables_copy = tables_ancestors.copy()
 
-            # chain rule: multiply all cpts for every cpt
-            for i in range(len(tables_copy)-1):
-                product = self.factor_multiplication(tables_ancestors[i], tables_ancestors[i+1])
-                tables_ancestors[i+1]= product
+    def probability_of_evidence(self, evidence: pd.Series) -> float:
+        """
+        Compute Pr(e) by eliminating all variables with the evidence applied. Only the ancestors of the evidence
+        take part, and the plan is cached per set of evidence variables.
+        """
+        return float(np.exp(self.log_probability_of_evidence(evidence)))
 
-            # remove already multiplied cpts from list
-            cpt_list = [table for table in cpt_list if ancestor not in table.columns]
 
-            # and append summed out table of ancestor to list
-            product = self.marginalization(product, ancestor)
-            cpt_list.append(product)
+    def log_probability_of_evidence(self, evidence: pd.Series) -> float:
+        """
+        Compute the natural logarithm of Pr(e) by variable elimination, which stays finite in the scaled mode
+        when Pr(e) itself underflows.
+        """
+        with self.trace_query('evidence', [], evidence.index):
+            return self.joint_factor([], evidence).log_total()
 
-        # in case of multiple variables in query, and a variable in query is an ancestor of other variable in query
-        # there will be a factor 'outside' of the summations, this factor also needs to be multiplied
-        if len(cpt_list) > 1:
-            for i in range(len(cpt_list)-1):
-                product = self.factor_multiplication(cpt_list[i], cpt_list[i+1])
-                cpt_list[i+1] = product
 
-        return product
+    def junction_tree(self) -> JunctionTree:
+        """
+        Returns the junction tree of the BN, built from the elimination order of all variables on first use.
+        """
+        if self._junction_tree is None:
+            order = self.find_order(self.bn.get_all_variables())
+            self._junction_tree = JunctionTree(self.bn, order)
+        return self._junction_tree
 
 
-    def marginal_distributions(self, query: List[str], evidence: pd.Series) -> pd.DataFrame:
+    def recursive_conditioning(self) -> RecursiveConditioning:
         """
-        Sum out a set of variables by using variable elimination.
-        return: posterior marginal
+        Returns the recursive conditioning engine of the BN, with a dtree built from the elimination order of all
+        variables on first use.
         """
-        # compute Pr(Q ^ E)
-        prior_marginal = self.variable_elimination(query, evidence)
-        posterior_marginal = prior_marginal
+        if self._recursive_conditioning is None:
+            order = self.find_order(self.bn.get_all_variables())
+            self._recursive_conditioning = RecursiveConditioning(self.bn, order, self.rc_cache_size)
+        return self._recursive_conditioning
 
-        for variable, value in evidence.items():
-            # compute the marginal P(E)
-            cpt_evidence = self.bn.get_cpt(variable)
-            marginal = cpt_evidence.loc[cpt_evidence[variable]==value, 'p'].iloc[0]
 
-            #compute the posterior marginal Pr(Q|E) = Pr(Q ^ E) / P(E)
-            posterior_marginal['p'] = posterior_marginal['p'] / marginal
+    def compile_circuit(self) -> ArithmeticCircuit:
+        """
+        Compiles the BN to an arithmetic circuit along the elimination order of all variables. The circuit answers
+        Pr(e) and all posterior marginals for any evidence without the reasoner, and can be saved to disk.
+        """
+        with self.trace_query('compile', [], []):
+            with self.trace_operation('order'):
+                order = self.find_order(self.bn.get_all_variables())
+            with self.trace_operation('compile'):
+                return ArithmeticCircuit.compile(self.bn, order)
 
-        return posterior_marginal
 
+    def sampler(self) -> Sampler:
+        """
+        Returns the sampler of the BN, built on first use.
+        """
+        if self._sampler is None:
+            self._sampler = Sampler(self.bn, self.seed)
+        return self._sampler
 
-    # --------------------------------- Most Likely Instantiations --------------------------------- #
+
+    def approximate_marginals(self, query: List[str], evidence: pd.Series, method: str = 'lw',
+                              n_samples: Optional[int] = None, target_se: Optional[float] = None,
+                              time_limit: Optional[float] = None) -> Tuple[pd.DataFrame, int]:
+        """
+        Estimate the posterior marginal of the query by sampling ('logic', 'lw' or 'gibbs'). Sampling stops after
+        n_samples samples, once every entry has a standard error of at most target_se, or after time_limit
+        seconds, whichever comes first.
+        return: the posterior marginal with an extra column 'se' holding the standard error of every entry, and
+            the number of samples drawn
+        """
+        if n_samples is None:
+            n_samples = self.n_samples
+        evidence = self.bn.encode_instantiation(evidence)
+        posterior, se, drawn = self.sampler().estimate(query, evidence, method, n_samples, target_se, time_limit)
+
+        table = posterior.to_dataframe()
+        table['se'] = se.values.flatten()
+        return table, drawn
 
 
-    def MAP(self, query: List[str], evidence: pd.Series) -> pd.DataFrame:
+    def all_marginals(self, evidence: pd.Series) -> Dict[str, pd.DataFrame]:
         """
-        Compute the maximum a-posteriory instantiation + value of query variables Q,
-        given a possibly empty evidence e
+        Compute the posterior marginal of every variable given the evidence by calibrating the junction tree once.
+        return: dictionary of posterior marginals indexed by variable
+        """
+        junction_tree = self.junction_tree()
+        junction_tree.calibrate(self.bn.encode_instantiation(evidence))
+        return {variable: junction_tree.marginal([variable]).to_dataframe() for variable in self.bn.get_all_variables()}
+
+
+    def batch_marginal_distributions(self, query: List[str], evidence: pd.DataFrame) -> np.ndarray:
+        """
+        Compute the posterior marginal of the query for every row of a DataFrame of evidence instantiations
+        in one vectorized variable elimination, instead of one elimination per row.
+        return: N x (number of instantiations of Q) array of posteriors, the columns in the row order of
+            marginal_distributions
+        """
+        evidence = self.bn.encode_instantiations(evidence)
+        with self.trace_query('batch posterior', query, evidence.columns):
+            plan = self.compile_plan(query, evidence.columns.tolist(), normalized=True)
+            if not self.fits_budget(plan, len(evidence)):
+                raise MemoryBudgetError([BATCH] + plan.widest, plan.peak_cells * len(evidence), self.memory_budget)
+            joint = plan.execute_batch(self.bn, evidence, self.executor, self.tracer).values.reshape(len(evidence), -1)
+
+            # Pr(Q | e) = Pr(Q ^ e) / Pr(e) for every row
+            return joint / joint.sum(axis=1, keepdims=True)
+
+
+    def batch_probability_of_evidence(self, evidence: pd.DataFrame) -> np.ndarray:
         """
-        # get the marginal distribution
-        posterior_marginal = self.marginal_distributions(query, evidence)
+        Compute Pr(e) for every row of a DataFrame of evidence instantiations in one vectorized elimination,
+        e.g. to score how anomalous every row is.
+        return: array with Pr(e) of every row
+        """
+        evidence = self.bn.encode_instantiations(evidence)
+        with self.trace_query('batch evidence', [], evidence.columns):
+            plan = self.compile_plan([], evidence.columns.tolist())
+            if not self.fits_budget(plan, len(evidence)):
+                raise MemoryBudgetError([BATCH] + plan.widest, plan.peak_cells * len(evidence), self.memory_budget)
+            return plan.execute_batch(self.bn, evidence, self.executor, self.tracer).values.copy()
+
+
+    # --------------------------------- Most Likely Instantiations --------------------------------- #
 
-        # get the most likely instantiation
-        max_out = self.max_out(posterior_marginal, query)
 
-        return max_out
+    def state_value(self, variable: str, value) -> Union[bool, int]:
+        """
+        Returns a state index in the form the reasoner reports it: a boolean for binary variables, an int otherwise.
+        """
+        return bool(value) if self.bn.get_cardinality(variable) == 2 else int(value)
 
 
-    def MPE(self, evidence: pd.Series) -> pd.Series:
+    def MAP(self, query: List[str], evidence: pd.Series, k: int = 1) -> pd.DataFrame:
+        """
+        Compute the maximum a-posteriory instantiation + value of query variables Q,
+        given a possibly empty evidence e.
+        The other variables are summed out first, then the query is maxed out with back-pointers,
+        so the instantiation is found by traceback instead of from the joint over Q.
+        :param k: number of most probable instantiations to return
+        return: the k most probable instantiations with their posterior probability, most probable first
+        """
+        evidence = self.bn.encode_instantiation(evidence)
+        with self.trace_query('MAP', query, evidence.index):
+            # barren variables and components d-separated from the query cancel out of the posterior
+            free = [q for q in query if q not in evidence.index]
+            with self.trace_operation('relevance'):
+                components, _ = self.relevance(free, evidence.index.tolist(), normalized=True)
+            variables = [v for component in components for v in component]
+
+            # constrained order: first sum out the non-query variables, then max out the query
+            hidden = [v for v in variables if v not in query and v not in evidence.index]
+            with self.trace_operation('order'):
+                sum_order = self.find_order(hidden)
+                max_order = self.find_order(free)
+            if self.tracer is not None:
+                self.tracer.order(sum_order + max_order)
+
+            # maxing out builds the same scopes as summing out, with k candidates per entry
+            if self.memory_budget is not None:
+                scopes = [self.bn.get_factor(v).variables for v in variables]
+                plan = QueryPlan([], evidence.index.tolist(), variables, sum_order + max_order, scopes,
+                                 {v: self.bn.get_cardinality(v) for scope in scopes for v in scope})
+                if not self.fits_budget(plan, k):
+                    raise MemoryBudgetError(plan.widest, plan.peak_cells * k, self.memory_budget)
+
+            with self.trace_operation('reduce'):
+                factors = [self.bn.get_factor(v).reduce(evidence) for v in variables]
+                if self.scaled:
+                    factors = [f.rescale() for f in factors]
+            with self.trace_operation('sum_product'):
+                factors = Factor.sum_product(factors, sum_order, self.scaled)
+            if self.tracer is not None:
+                for factor in factors:
+                    self.tracer.factor(factor)
+
+            # evidence on query variables is fixed
+            with self.trace_operation('max_product'):
+                explanations = KBestFactor.eliminate(factors, max_order, k, self.scaled,
+                                                     {q: self.bn.get_cardinality(q) for q in free})
+
+            # Pr(e) for the posterior, summing out the query from the same factors
+            with self.trace_operation('sum_product'):
+                evidence_factor = Factor.product(Factor.sum_product(factors, max_order, self.scaled))
+
+            rows = []
+            for instantiation, p in explanations:
+                row = {q: instantiation[q] if q in instantiation else self.state_value(q, evidence[q]) for q in query}
+                if self.scaled:
+                    # the values are logarithms
+                    row['p'] = np.exp(p - evidence_factor.log_total())
+                else:
+                    row['p'] = p / float(evidence_factor.values * np.exp(evidence_factor.log_scale))
+                rows.append(row)
+
+            return pd.DataFrame(rows, columns=query + ['p'])
+
+
+    def MPE(self, evidence: pd.Series, k: int = 1) -> pd.DataFrame:
         """
         Compute the most likely instantiation of the query variables given the evidence.
+        :param k: number of most probable explanations to return
         """
         # get all variables in the BN
-        variables = self.bn.get_variables()
+        variables = self.bn.get_all_variables()
         # get all query variables
         query = [variable for variable in variables if not variable in evidence.index]
 
-        return self.MAP(query, evidence)
+        with self.trace_query('MPE', query, evidence.index):
+            return self.MAP(query, evidence, k)
 
 
         # # compute the marginal distributions
@@ -1,11 +1,12 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Union, Optional
+from xml.etree import ElementTree
+import hashlib
+import os
 import networkx as nx
 import matplotlib.pyplot as plt
-from pgmpy.readwrite import XMLBIFReader
-import math
-import itertools
+import numpy as np
 import pandas as pd
-from copy import deepcopy
+from Factor import Factor
 
 
 class BayesNet:
@@ -15,66 +16,204 @@ class BayesNet:
         self.structure = nx.DiGraph()
 
     # LOADING FUNCTIONS ------------------------------------------------------------------------------------------------
-    def create_bn(self, variables: List[str], edges: List[Tuple[str, str]], cpts: Dict[str, pd.DataFrame]) -> None:
+    def create_bn(self, variables: List[str], edges: List[Tuple[str, str]],
+                  cpts: Dict[str, Union[pd.DataFrame, Factor]], states: Optional[Dict[str, List[str]]] = None) -> None:
         """
         Creates the BN according to the python objects passed in.
 
         :param variables: List of names of the variables.
         :param edges: List of the directed edges.
-        :param cpts: Dictionary of conditional probability tables.
+        :param cpts: Dictionary of conditional probability tables, as DataFrames or Factors.
+        :param states: Names of the states of the variables, in the order of their indices. Variables without
+            names get the default ones, see get_states.
         """
         # add nodes
         [self.add_var(v, cpt=cpts[v]) for v in variables]
+        for variable, names in (states or {}).items():
+            self.structure.nodes[variable]['states'] = list(names)
 
-        # add edges
-        [self.add_edge(e) for e in edges]
+        # add edges, checking for cycles once at the end instead of after every edge
+        edges = [tuple(e) for e in edges]
+        if len(set(edges)) != len(edges) or any(self.structure.has_edge(*e) for e in edges):
+            raise Exception('Edge already exists.')
+        self.structure.add_edges_from(edges)
 
         # check for cycles
         if not nx.is_directed_acyclic_graph(self.structure):
             raise Exception('The provided graph is not acyclic.')
 
-    def load_from_bifxml(self, file_path: str) -> None:
+    def load_from_bifxml(self, file_path: str, cache_dir: Optional[str] = None) -> None:
         """
         Load a BayesNet from a file in BIFXML file format. See description of BIFXML here:
         http://www.cs.cmu.edu/afs/cs/user/fgcozman/www/Research/InterchangeFormat/
 
         :param file_path: Path to the BIFXML file.
+        :param cache_dir: Directory of the parsed network cache. If given, the network is loaded from the cache
+            entry for the hash of the file when there is one, and written to the cache otherwise.
+        """
+        if cache_dir is not None:
+            with open(file_path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            cache_path = os.path.join(cache_dir, digest)
+            if os.path.exists(cache_path + '.npz'):
+                self.load_from_cache(cache_path)
+                return
+
+        variables, edges, cpts, states = self.parse_bifxml(file_path)
+        self.create_bn(variables, edges, cpts, states)
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.write_cache(cache_path)
+
+    @staticmethod
+    def parse_bifxml(file_path: str) -> Tuple[List[str], List[Tuple[str, str]], Dict[str, Factor],
+                                              Dict[str, List[str]]]:
         """
-        # Read and parse the bifxml file
-        with open(file_path) as f:
-            bn_file = f.read()
-        bif_reader = XMLBIFReader(string=bn_file)
+        Streams through a BIFXML file and builds the CPT arrays directly.
+        The table of a definition is read with the parents in reversed order followed by the variable itself.
+        The states of every variable are indexed in the order of its outcomes; for binary variables the first
+        outcome stands for False, so binary outcomes named True and False are listed as False, True whatever
+        their order in the file.
 
-        # load cpts
+        :param file_path: Path to the BIFXML file.
+        :return: The variables, the edges, the CPTs as Factors and the names of the states of every variable.
+        """
+        variables = []
+        edges = []
+        states = {}
+        definitions = []
+        for _, element in ElementTree.iterparse(file_path):
+            if element.tag == 'VARIABLE':
+                variable = element.findtext('NAME').strip()
+                states[variable] = BayesNet.order_states([outcome.text.strip()
+                                                          for outcome in element.findall('OUTCOME')])
+                if not states[variable]:
+                    raise ValueError('Variable {} has no outcomes.'.format(variable))
+                variables.append(variable)
+                element.clear()
+
+            elif element.tag == 'DEFINITION':
+                variable = element.findtext('FOR').strip()
+                parents = [given.text.strip() for given in element.findall('GIVEN')]
+                definitions.append((variable, parents[::-1] + [variable],
+                                    np.array(element.findtext('TABLE').split(), dtype=np.float64)))
+                edges += [(parent, variable) for parent in parents]
+                element.clear()
+
+        # the tables are shaped once the outcomes of all variables are known
         cpts = {}
-        # iterating through vars
-        for key, values in bif_reader.get_values().items():
-            values = values.transpose().flatten()
-            n_vars = int(math.log2(len(values)))
-            worlds = [list(i) for i in itertools.product(
-                [False, True], repeat=n_vars)]
-            # create empty array
-            cpt = []
-            # iterating through worlds within a variable
-            for i in range(len(values)):
-                # add the probability to each possible world
-                worlds[i].append(values[i])
-                cpt.append(worlds[i])
-
-            # determine column names
-            columns = bif_reader.get_parents()[key]
-            columns.reverse()
-            columns.append(key)
-            columns.append('p')
-            cpts[key] = pd.DataFrame(cpt, columns=columns)
-
-        # load vars
-        variables = bif_reader.get_variables()
-
-        # load edges
-        edges = bif_reader.get_edges()
-
-        self.create_bn(variables, edges, cpts)
+        for variable, scope, values in definitions:
+            shape = tuple(len(states[v]) for v in scope)
+            if len(values) != np.prod(shape, dtype=np.int64):
+                raise ValueError('Table of {} does not match its parents.'.format(variable))
+            cpts[variable] = Factor(scope, values.reshape(shape))
+
+        return variables, edges, cpts, states
+
+    @staticmethod
+    def order_states(names: List[str]) -> List[str]:
+        """
+        Returns the state names of a variable in the order of their indices: binary states named True and False
+        (in any case) follow the convention that index 0 stands for False, other names keep their order.
+        """
+        if len(names) == 2 and sorted(name.lower() for name in names) == ['false', 'true']:
+            return sorted(names, key=lambda name: name.lower() == 'true')
+        return list(names)
+
+    def write_bifxml(self, file_path: str, name: str = 'network') -> None:
+        """
+        Writes the network as a BIFXML file that load_from_bifxml reads back into the same CPTs.
+
+        :param file_path: Path of the BIFXML file.
+        :param name: Name of the network in the file.
+        """
+        bif = ElementTree.Element('BIF', VERSION='0.3')
+        network = ElementTree.SubElement(bif, 'NETWORK')
+        ElementTree.SubElement(network, 'NAME').text = name
+
+        variables = self.get_all_variables()
+        for variable in variables:
+            element = ElementTree.SubElement(network, 'VARIABLE', TYPE='nature')
+            ElementTree.SubElement(element, 'NAME').text = variable
+            for state in self.get_states(variable):
+                ElementTree.SubElement(element, 'OUTCOME').text = state
+
+        for variable in variables:
+            factor = self.get_factor(variable)
+            parents = [v for v in factor.variables if v != variable]
+
+            # the table is read with the parents in reversed order of the GIVEN elements
+            element = ElementTree.SubElement(network, 'DEFINITION')
+            ElementTree.SubElement(element, 'FOR').text = variable
+            for parent in parents[::-1]:
+                ElementTree.SubElement(element, 'GIVEN').text = parent
+            table = factor.expand(parents + [variable]).ravel()
+            ElementTree.SubElement(element, 'TABLE').text = ' '.join(repr(float(p)) for p in table)
+
+        ElementTree.indent(bif)
+        ElementTree.ElementTree(bif).write(file_path, encoding='US-ASCII', xml_declaration=True)
+
+    def write_cache(self, cache_path: str) -> None:
+        """
+        Writes the parsed network to cache_path + '.npz' (names, edges, scopes and states) and
+        cache_path + '.values.npy' (all CPT values in one flat array, which is memory-mapped when the cache is
+        loaded).
+
+        :param cache_path: Path of the cache entry without extension.
+        """
+        variables = self.get_all_variables()
+        factors = [self.get_factor(v) for v in variables]
+        scopes = [f.variables for f in factors]
+        sizes = [f.values.size for f in factors]
+
+        states = [self.get_states(v) for v in variables]
+        values = np.concatenate([f.values.ravel() for f in factors]) if factors else np.zeros(0)
+        np.save(cache_path + '.values.npy', values)
+
+        # the .npz is written last and atomically, so its existence marks a complete entry
+        with open(cache_path + '.tmp.npz', 'wb') as f:
+            np.savez(f,
+                     variables=np.array(variables, dtype=str),
+                     edges=np.array(list(self.structure.edges), dtype=str).reshape(-1, 2),
+                     scope_names=np.array([v for scope in scopes for v in scope], dtype=str),
+                     scope_lengths=np.array([len(scope) for scope in scopes], dtype=np.int64),
+                     value_offsets=np.cumsum([0] + sizes).astype(np.int64),
+                     state_names=np.array([name for names in states for name in names], dtype=str),
+                     cardinalities=np.array([len(names) for names in states], dtype=np.int64))
+        os.replace(cache_path + '.tmp.npz', cache_path + '.npz')
+
+    def load_from_cache(self, cache_path: str) -> None:
+        """
+        Loads a network written by write_cache. The CPT values are memory-mapped, CPT DataFrames are only built
+        when get_cpt asks for them.
+
+        :param cache_path: Path of the cache entry without extension.
+        """
+        with np.load(cache_path + '.npz') as meta:
+            variables = meta['variables'].tolist()
+            edges = [tuple(e) for e in meta['edges'].tolist()]
+            scope_names = meta['scope_names'].tolist()
+            scope_offsets = np.cumsum(np.concatenate([[0], meta['scope_lengths']])).tolist()
+            value_offsets = meta['value_offsets'].tolist()
+
+            # entries written before multi-valued variables were supported only hold binary variables
+            if 'cardinalities' in meta:
+                state_offsets = np.cumsum(np.concatenate([[0], meta['cardinalities']])).tolist()
+                state_names = meta['state_names'].tolist()
+                states = {v: self.order_states(state_names[state_offsets[i]:state_offsets[i + 1]])
+                          for i, v in enumerate(variables)}
+            else:
+                states = {}
+        values = np.load(cache_path + '.values.npy', mmap_mode='r')
+
+        cpts = {}
+        for i, variable in enumerate(variables):
+            scope = scope_names[scope_offsets[i]:scope_offsets[i + 1]]
+            flat = values[value_offsets[i]:value_offsets[i + 1]]
+            cpts[variable] = Factor(scope, flat.reshape([len(states.get(v, (0, 1))) for v in scope]))
+
+        self.create_bn(variables, edges, cpts, states)
 
     # METHODS THAT MIGHT ME USEFUL -------------------------------------------------------------------------------------
 
@@ -93,9 +232,131 @@ class BayesNet:
         :return: Conditional probability table of 'variable' as a pandas DataFrame.
         """
         try:
-            return self.structure.nodes[variable]['cpt']
+            node = self.structure.nodes[variable]
         except KeyError:
             raise Exception('Variable not in the BN')
+        # CPTs loaded as Factors get their DataFrame on first use
+        if 'cpt' not in node:
+            node['cpt'] = node['factor'].to_dataframe()
+        return node['cpt']
+
+    def get_scope(self, variable: str) -> List[str]:
+        """
+        Returns the variables mentioned in the CPT of a variable, without building a CPT DataFrame.
+        :param variable: Variable of which the CPT scope should be returned.
+        :return: List of the variables in the CPT.
+        """
+        try:
+            node = self.structure.nodes[variable]
+        except KeyError:
+            raise Exception('Variable not in the BN')
+        if 'factor' in node:
+            return list(node['factor'].variables)
+        return [c for c in node['cpt'].columns if c != 'p']
+
+    def get_factor(self, variable: str) -> Factor:
+        """
+        Returns the conditional probability table of a variable in the BN as a dense Factor. The Factor is built once
+        and kept on the node until the CPT is replaced.
+        :param variable: Variable of which the CPT should be returned.
+        :return: Conditional probability table of 'variable' as a Factor.
+        """
+        try:
+            node = self.structure.nodes[variable]
+        except KeyError:
+            raise Exception('Variable not in the BN')
+        if 'factor' not in node:
+            node['factor'] = Factor.from_dataframe(node['cpt'])
+        return node['factor']
+
+    def get_cardinality(self, variable: str) -> int:
+        """
+        Returns the number of values of a variable, read from the size of its CPT.
+        :param variable: Variable of which the cardinality should be returned.
+        :return: Number of values of the variable.
+        """
+        factor = self.get_factor(variable)
+        return factor.values.shape[factor.variables.index(variable)]
+
+    def get_states(self, variable: str) -> List[str]:
+        """
+        Returns the names of the states of a variable, in the order of their indices. Variables created without
+        names have the states 'False' and 'True' if binary, and '0', '1', ... otherwise.
+        :param variable: Variable of which the states should be returned.
+        :return: List of state names.
+        """
+        names = self.structure.nodes[variable].get('states')
+        if names is not None:
+            return names
+        cardinality = self.get_cardinality(variable)
+        return ['False', 'True'] if cardinality == 2 else [str(i) for i in range(cardinality)]
+
+    @staticmethod
+    def encode_state(variable: str, value, names: List[str]) -> Union[bool, int]:
+        """
+        Returns the state index of one value of a variable: state names are looked up, booleans and integral
+        numbers are kept as indices. Raises a ValueError for unknown names, out-of-range indices and non-integral
+        numbers.
+
+        :param variable: The variable, for the error message.
+        :param value: State name or index.
+        :param names: Names of the states of the variable.
+        """
+        if isinstance(value, str):
+            if value in names:
+                return names.index(value)
+        elif isinstance(value, (bool, np.bool_)):
+            return bool(value)
+        elif isinstance(value, (int, np.integer)) or (isinstance(value, (float, np.floating)) and value.is_integer()):
+            if 0 <= value < len(names):
+                return int(value)
+        raise ValueError('{!r} is not a state of {}, whose states are {} (or their indices 0 to {}).'.format(
+            value, variable, names, len(names) - 1))
+
+    @staticmethod
+    def encode_column(variable: str, column: pd.Series, names: List[str]) -> pd.Series:
+        """
+        Same as encode_state, for a column of values. Every distinct value is encoded once.
+        """
+        if pd.api.types.is_bool_dtype(column):
+            return column
+        return column.map({value: BayesNet.encode_state(variable, value, names) for value in column.unique()})
+
+    def encode_instantiation(self, instantiation: pd.Series) -> pd.Series:
+        """
+        Converts the state names in an instantiation to state indices, the representation all inference uses.
+        Booleans and integers are already indices and are kept. Raises a ValueError for unknown variables and for
+        values that are not a state of their variable, see encode_state.
+
+        :param instantiation: a series of assignments as tuples. E.g.: pd.Series({"A": True, "B": "high"})
+        :return: The instantiation with integer state indices for the named states.
+        """
+        encoded = {}
+        for variable, value in instantiation.items():
+            if variable not in self.structure:
+                raise ValueError('{} is not a variable of the BN.'.format(variable))
+            encoded[variable] = self.encode_state(variable, value, self.get_states(variable))
+        return pd.Series(encoded, dtype=object)
+
+    def encode_instantiations(self, table: pd.DataFrame) -> pd.DataFrame:
+        """
+        Same as encode_instantiation, for a DataFrame with one instantiation per row.
+        """
+        encoded = {}
+        for variable in table.columns:
+            if variable not in self.structure:
+                raise ValueError('{} is not a variable of the BN.'.format(variable))
+            encoded[variable] = self.encode_column(variable, table[variable], self.get_states(variable))
+        return pd.DataFrame(encoded, index=table.index)
+
+    def fingerprint(self) -> str:
+        """
+        Returns a hash of the variables, their CPT scopes and cardinalities, which identifies the BN for the orders
+        stored by OrderStore.
+        :return: Hexadecimal SHA-256 hash.
+        """
+        description = sorted((v, self.get_scope(v), self.get_cardinality(v)) for v in self.get_all_variables())
+        return hashlib.sha256(repr(description).encode()).hexdigest()
 
     def get_all_variables(self) -> List[str]:
         """
@@ -126,7 +387,7 @@ class BayesNet:
 
         # connect all variables with an edge which are mentioned in a CPT together
         for var in self.get_all_variables():
-            involved_vars = list(self.get_cpt(var).columns)[:-1]
+            involved_vars = self.get_scope(var)
             for i in range(len(involved_vars)-1):
                 for j in range(i+1, len(involved_vars)):
                     if not int_graph.has_edge(involved_vars[i], involved_vars[j]):
@@ -145,8 +406,7 @@ class BayesNet:
         var_names = instantiation.index.values
         # get rid of excess variables names
         var_names = [v for v in var_names if v in cpt.columns]
-        compat_indices = cpt[var_names] == instantiation[var_names].values
-        compat_indices = [all(x[1]) for x in compat_indices.iterrows()]
+        compat_indices = (cpt[var_names] == instantiation[var_names].values).all(axis=1)
         compat_instances = cpt.loc[compat_indices]
         return compat_instances
 
@@ -157,15 +417,17 @@ class BayesNet:
         :param cpt: new CPT
         """
         self.structure.nodes[variable]["cpt"] = cpt
+        self.structure.nodes[variable].pop("factor", None)
 
     @staticmethod
-    def reduce_factor(instantiation: pd.Series, cpt: pd.DataFrame) -> pd.DataFrame:
+    def reduce_factor(instantiation: pd.Series, cpt: pd.DataFrame, drop: bool = False) -> pd.DataFrame:
         """
         Creates and returns a new factor in which all probabilities which are incompatible with the instantiation
-        passed to the method to 0.
+        passed to the method to 0. CPTs that do not mention the evidence are returned as is, without a copy.
 
         :param instantiation: a series of assignments as tuples. E.g.: pd.Series({"A": True, "B": False})
         :param cpt: cpt to be reduced
+        :param drop: if True, drop the incompatible rows and the evidence columns instead of zeroing probabilities
         :return: cpt with their original probability value and zero probability for incompatible instantiations
         """
         var_names = instantiation.index.values
@@ -173,14 +435,31 @@ class BayesNet:
         var_names = [v for v in var_names if v in cpt.columns]
 
         if len(var_names) > 0:  # only reduce the factor if the evidence appears in it
-            new_cpt = deepcopy(cpt)
-            incompat_indices = cpt[var_names] != instantiation[var_names].values
-            incompat_indices = [any(x[1]) for x in incompat_indices.iterrows()]
-            new_cpt.loc[incompat_indices, 'p'] = 0.0
-            return new_cpt
+            compat_indices = (cpt[var_names] == instantiation[var_names].values).all(axis=1)
+            if drop:
+                return cpt.loc[compat_indices].drop(columns=var_names).reset_index(drop=True)
+            return cpt.assign(p=cpt['p'].where(compat_indices, 0.0))
         else:
             return cpt
 
+    def reduce_all_factors(self, instantiation: pd.Series, drop: bool = False) -> Dict[str, pd.DataFrame]:
+        """
+        Applies the instantiation to every CPT in the network in one call, see reduce_factor.
+
+        :param instantiation: a series of assignments as tuples. E.g.: pd.Series({"A": True, "B": False})
+        :param drop: if True, drop the incompatible rows and the evidence columns instead of zeroing probabilities
+        :return: Dictionary of all reduced CPTs indexed by the variable they belong to.
+        """
+        return {var: self.reduce_factor(instantiation, cpt, drop=drop) for var, cpt in self.get_all_cpts().items()}
+
+    def view(self) -> 'BayesNetView':
+        """
+        Returns a view on the BN that shares the structure and CPTs and only allocates what is changed on it.
+        Use this instead of a deepcopy to prune or reduce the BN.
+        :return: A BayesNetView of this BN.
+        """
+        return BayesNetView(self)
+
     def draw_structure(self) -> None:
         """
         Visualize structure of the BN.
@@ -190,14 +469,16 @@ class BayesNet:
 
     # BASIC HOUSEKEEPING METHODS ---------------------------------------------------------------------------------------
 
-    def add_var(self, variable: str, cpt: pd.DataFrame) -> None:
+    def add_var(self, variable: str, cpt: Union[pd.DataFrame, Factor]) -> None:
         """
         Add a variable to the BN.
         :param variable: variable to be added.
-        :param cpt: conditional probability table of the variable.
+        :param cpt: conditional probability table of the variable, as a DataFrame or a Factor.
         """
         if variable in self.structure.nodes:
             raise Exception('Variable already exists.')
+        elif isinstance(cpt, Factor):
+            self.structure.add_node(variable, factor=cpt)
         else:
             self.structure.add_node(variable, cpt=cpt)
 
@@ -230,3 +511,99 @@ class BayesNet:
         :param edge: Edge to be deleted (e.g. ('A', 'B')).
         """
         self.structure.remove_edge(edge[0], edge[1])
+
+
+class BayesNetView(BayesNet):
+    """
+    Lightweight view on a BayesNet for pruning and evidence reduction. The view shares the structure and all CPTs
+    with its parent and only stores what changed: deleted variables, deleted edges and replaced CPTs. Changes to the
+    view never affect the parent.
+    """
+
+    def __init__(self, parent: BayesNet) -> None:
+        """
+        :param parent: The BN (or view) to look at.
+        """
+        self.parent = parent
+        self.hidden_nodes = set()
+        self.hidden_edges = set()
+        self.cpts = {}
+        self.factors = {}
+
+        # live filtered view of the parent structure, the filters read the sets above
+        self.structure = nx.subgraph_view(parent.structure,
+                                          filter_node=lambda n: n not in self.hidden_nodes,
+                                          filter_edge=lambda u, v: (u, v) not in self.hidden_edges)
+
+    def get_cpt(self, variable: str) -> pd.DataFrame:
+        """
+        Returns the conditional probability table of a variable in the view.
+        :param variable: Variable of which the CPT should be returned.
+        :return: Conditional probability table of 'variable' as a pandas DataFrame.
+        """
+        if variable not in self.structure.nodes:
+            raise Exception('Variable not in the BN')
+        if variable in self.cpts:
+            return self.cpts[variable]
+        return self.parent.get_cpt(variable)
+
+    def get_scope(self, variable: str) -> List[str]:
+        """
+        Returns the variables mentioned in the CPT of a variable in the view.
+        :param variable: Variable of which the CPT scope should be returned.
+        :return: List of the variables in the CPT.
+        """
+        if variable not in self.structure.nodes:
+            raise Exception('Variable not in the BN')
+        if variable in self.cpts:
+            return [c for c in self.cpts[variable].columns if c != 'p']
+        return self.parent.get_scope(variable)
+
+    def get_factor(self, variable: str) -> Factor:
+        """
+        Returns the conditional probability table of a variable in the view as a dense Factor.
+        :param variable: Variable of which the CPT should be returned.
+        :return: Conditional probability table of 'variable' as a Factor.
+        """
+        if variable not in self.cpts:
+            return self.parent.get_factor(variable)
+        if variable not in self.factors:
+            # the replaced CPT keeps the states of the variables in the parent
+            cardinalities = {v: self.parent.get_cardinality(v) for v in self.get_scope(variable)}
+            self.factors[variable] = Factor.from_dataframe(self.cpts[variable], cardinalities)
+        return self.factors[variable]
+
+    def update_cpt(self, variable: str, cpt: pd.DataFrame) -> None:
+        """
+        Replace the conditional probability table of a variable in the view only.
+        :param variable: Variable to be modified
+        :param cpt: new CPT
+        """
+        self.cpts[variable] = cpt
+        self.factors.pop(variable, None)
+
+    def add_var(self, variable: str, cpt: pd.DataFrame) -> None:
+        raise Exception('Cannot add variables to a view.')
+
+    def add_edge(self, edge: Tuple[str, str]) -> None:
+        raise Exception('Cannot add edges to a view.')
+
+    def del_var(self, variable: str) -> None:
+        """
+        Delete a variable from the view.
+        :param variable: Variable to be deleted.
+        """
+        if variable not in self.structure.nodes:
+            raise Exception('Variable not in the BN')
+        self.hidden_nodes.add(variable)
+        self.cpts.pop(variable, None)
+        self.factors.pop(variable, None)
+
+    def del_edge(self, edge: Tuple[str, str]) -> None:
+        """
+        Delete an edge from the view.
+        :param edge: Edge to be deleted (e.g. ('A', 'B')).
+        """
+        if not self.structure.has_edge(edge[0], edge[1]):
+            raise Exception('Edge not in the BN')
+        self.hidden_edges.add((edge[0], edge[1]))
@@ -0,0 +1,238 @@
+from typing import List, Dict, Union, Optional
+import itertools
+import numpy as np
+import pandas as pd
+
+
+def state_dtype(cardinality: int) -> np.dtype:
+    """
+    Returns the smallest signed integer type that holds the state indices of a variable with 'cardinality' states.
+    """
+    return np.result_type(np.int8, np.min_scalar_type(max(cardinality, 1) - 1))
+
+
+class Factor:
+    """
+    Dense factor over discrete variables: the scope of the factor plus an n-dimensional float64 array with one axis
+    per variable, of the size of its number of states. States are integer indices along the axis; for binary
+    variables index 0 stands for False and index 1 for True.
+
+    A factor can carry a scale: the value of an instantiation is values * exp(log_scale). Rescaling after every
+    operation keeps the values around 1, so products of many small probabilities do not underflow.
+    """
+
+    def __init__(self, variables: List[str], values: np.ndarray, log_scale: float = 0.0) -> None:
+        """
+        :param variables: Scope of the factor, one variable per axis of 'values'.
+        :param values: Array holding the value of every instantiation of the scope.
+        :param log_scale: Natural logarithm of the scale the values are multiplied with.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim != len(variables):
+            raise ValueError('Factor has {} variables but {} axes.'.format(len(variables), values.ndim))
+
+        self.variables = list(variables)
+        self.values = values
+        self.log_scale = log_scale
+
+    # CONVERSION -------------------------------------------------------------------------------------------------------
+
+    @classmethod
+    def from_dataframe(cls, table: pd.DataFrame, cardinalities: Optional[Dict[str, int]] = None) -> 'Factor':
+        """
+        Builds a factor from a CPT in the DataFrame representation (boolean or state index columns plus a 'p'
+        column). Instantiations missing from the table get value 0.
+
+        :param table: CPT or factor as a pandas DataFrame.
+        :param cardinalities: Number of states per variable, by default the largest state in the table plus one,
+            and at least 2.
+        :return: The same factor as a Factor.
+        """
+        variables = [c for c in table.columns if c != 'p']
+        index = tuple(table[v].to_numpy().astype(int) for v in variables)
+        cardinalities = cardinalities or {}
+        shape = [cardinalities[v] if v in cardinalities else max(2, int(column.max(initial=0)) + 1)
+                 for v, column in zip(variables, index)]
+        values = np.zeros(shape)
+        values[index] = table['p'].to_numpy(dtype=np.float64)
+
+        return cls(variables, values)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Converts the factor back to the DataFrame representation used by BayesNet, with the rows in the same order
+        as the CPTs created by BayesNet.load_from_bifxml. Binary variables get boolean columns, the others small
+        integer state indices.
+
+        :return: The factor as a pandas DataFrame.
+        """
+        worlds = list(itertools.product(*[range(n) for n in self.values.shape]))
+        table = pd.DataFrame(worlds, columns=self.variables, dtype=np.int64)
+        for v, n in zip(self.variables, self.values.shape):
+            table[v] = table[v].astype(bool if n == 2 else state_dtype(n))
+        table['p'] = self.values.flatten() * np.exp(self.log_scale)
+
+        return table
+
+    # FACTOR OPERATIONS ------------------------------------------------------------------------------------------------
+
+    def expand(self, variables: List[str]) -> np.ndarray:
+        """
+        Returns the values as an array that broadcasts against a factor over 'variables'.
+
+        :param variables: Scope to broadcast to, must contain the scope of this factor.
+        :return: View of the values with the axes in the order of 'variables' and size 1 axes for missing variables.
+        """
+        axes = [self.variables.index(v) for v in variables if v in self.variables]
+        shape = [self.values.shape[self.variables.index(v)] if v in self.variables else 1 for v in variables]
+
+        return self.values.transpose(axes).reshape(shape)
+
+    def multiply(self, other: 'Factor') -> 'Factor':
+        """
+        Given another factor g, compute the multiplied factor h=fg.
+
+        :param other: Factor to multiply with.
+        :return: The product over the union of both scopes.
+        """
+        # a sparse factor does the join on its stored entries
+        if not isinstance(other, Factor):
+            return other.multiply(self)
+
+        variables = self.variables + [v for v in other.variables if v not in self.variables]
+
+        return Factor(variables, self.expand(variables) * other.expand(variables), self.log_scale + other.log_scale)
+
+    __mul__ = multiply
+
+    def sum_out(self, variables: Union[str, List[str]]) -> 'Factor':
+        """
+        Compute the factor in which the given variable(s) are summed-out.
+
+        :param variables: Variable or list of variables to sum out.
+        :return: Factor over the remaining variables.
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+        axes = tuple(self.variables.index(v) for v in variables)
+
+        return Factor([v for v in self.variables if v not in variables], self.values.sum(axis=axes), self.log_scale)
+
+    def max_out(self, variables: Union[str, List[str]]) -> 'Factor':
+        """
+        Compute the factor in which the given variable(s) are maxed-out.
+
+        :param variables: Variable or list of variables to max out.
+        :return: Factor over the remaining variables.
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+        axes = tuple(self.variables.index(v) for v in variables)
+
+        return Factor([v for v in self.variables if v not in variables], self.values.max(axis=axes), self.log_scale)
+
+    def reduce(self, instantiation: pd.Series, drop: bool = True) -> 'Factor':
+        """
+        Apply evidence to the factor.
+
+        :param instantiation: a series of assignments as tuples. E.g.: pd.Series({"A": True, "B": False})
+        :param drop: if True the evidence variables are sliced out of the scope, otherwise they are kept and all
+            incompatible instantiations are set to 0.
+        :return: The reduced factor, or the factor itself if none of the evidence appears in it.
+        """
+        var_names = [v for v in instantiation.index if v in self.variables]
+        if not var_names:
+            return self
+
+        index = [slice(None)] * len(self.variables)
+        for v in var_names:
+            index[self.variables.index(v)] = int(instantiation[v])
+
+        if drop:
+            return Factor([v for v in self.variables if v not in var_names], self.values[tuple(index)],
+                          self.log_scale)
+
+        values = np.zeros_like(self.values)
+        values[tuple(index)] = self.values[tuple(index)]
+        return Factor(self.variables, values, self.log_scale)
+
+    def reduce_batch(self, instantiations: pd.DataFrame, batch: str) -> 'Factor':
+        """
+        Apply N evidence instantiations at once: the evidence variables are sliced out and replaced by a leading
+        batch axis of size N, holding the reduced factor of every row.
+
+        :param instantiations: DataFrame with one evidence instantiation per row.
+        :param batch: name of the batch axis.
+        :return: The reduced factor with the batch axis first, or the factor itself if none of the evidence
+            appears in it.
+        """
+        var_names = [v for v in instantiations.columns if v in self.variables]
+        if not var_names:
+            return self
+
+        # move the evidence axes to the front and pick one entry per row
+        rest = [v for v in self.variables if v not in var_names]
+        values = self.expand(var_names + rest)
+        index = tuple(instantiations[v].to_numpy().astype(int) for v in var_names)
+
+        return Factor([batch] + rest, values[index], self.log_scale)
+
+    def normalize(self) -> 'Factor':
+        """
+        Returns the factor scaled so that its values sum to 1.
+        """
+        return Factor(self.variables, self.values / self.values.sum())
+
+    def rescale(self) -> 'Factor':
+        """
+        Returns the same factor with its largest value scaled to 1, the scaling moved into log_scale.
+        """
+        largest = self.values.max() if self.values.size else 0.0
+        if largest <= 0:
+            return self
+        return Factor(self.variables, self.values / largest, self.log_scale + np.log(largest))
+
+    def log_total(self) -> float:
+        """
+        Returns the natural logarithm of the sum of all values, e.g. log Pr(e) of a factor Pr(Q ^ e).
+        """
+        with np.errstate(divide='ignore'):
+            return float(np.log(self.values.sum()) + self.log_scale)
+
+    @staticmethod
+    def product(factors: List['Factor']) -> 'Factor':
+        """
+        Multiplies a list of factors together, the empty product being the trivial factor 1.
+
+        :param factors: Factors to multiply.
+        :return: The product of all factors.
+        """
+        result = Factor([], np.ones(()))
+        for factor in factors:
+            result = result.multiply(factor)
+
+        return result
+
+    @staticmethod
+    def sum_product(factors: List['Factor'], order: List[str], scaled: bool = False) -> List['Factor']:
+        """
+        Sums the variables out of the product of the factors one by one in the given order, only multiplying the
+        factors that mention the variable.
+
+        :param factors: Factors to eliminate from.
+        :param order: Elimination order.
+        :param scaled: If True every new factor is rescaled, see rescale.
+        :return: The remaining factors, whose product is the product of 'factors' with 'order' summed out.
+        """
+        for variable in order:
+            tables_variable = [f for f in factors if variable in f.variables]
+            if not tables_variable:
+                continue
+            factors = [f for f in factors if variable not in f.variables]
+            result = Factor.product(tables_variable).sum_out(variable)
+            factors.append(result.rescale() if scaled else result)
+
+        return factors
+
+    def __repr__(self) -> str:
+        return 'Factor({})'.format(self.variables)
@@ -0,0 +1,72 @@
+from typing import List, Dict, Any, Union
+import pandas as pd
+from BNReasoner import BNReasoner
+from JunctionTree import JunctionTree
+
+
+class InferenceSession:
+    """
+    Interactive inference on a junction tree of the BN of a reasoner, for evidence that arrives one variable at a
+    time. Every update only recomputes the messages affected by the changed variable.
+    """
+
+    def __init__(self, reasoner: BNReasoner) -> None:
+        """
+        :param reasoner: The reasoner whose BN and ordering method are used. The session has its own junction tree,
+            so it does not interfere with queries on the reasoner.
+        """
+        order = reasoner.find_order(reasoner.bn.get_all_variables())
+        self.junction_tree = JunctionTree(reasoner.bn, order)
+        self.evidence = pd.Series(dtype=object)
+
+        # one record per update: the variable, the operations performed and the operations saved
+        self.history = []
+        self._update(None)
+
+    def _update(self, variable: Any) -> int:
+        """
+        Calibrates the junction tree with the current evidence and records the work done.
+        :return: The number of factor operations saved compared with a full recompute.
+        """
+        performed = self.junction_tree.calibrate(self.evidence)
+        saved = self.junction_tree.full_operations - performed
+        self.history.append({'variable': variable, 'operations': performed, 'saved': saved})
+        return saved
+
+    def add_evidence(self, variable: str, value: Union[bool, int, str]) -> int:
+        """
+        Observes a variable, or changes the observed value (state index or name) of a variable.
+        :return: The number of factor operations saved compared with a full recompute.
+        """
+        if variable not in self.junction_tree.home:
+            raise Exception('Variable not in the BN')
+
+        self.evidence = self.evidence.copy()
+        self.evidence[variable] = self.junction_tree.bn.encode_instantiation(pd.Series({variable: value}))[variable]
+        return self._update(variable)
+
+    def retract_evidence(self, variable: str) -> int:
+        """
+        Removes the observation of a variable.
+        :return: The number of factor operations saved compared with a full recompute.
+        """
+        self.evidence = self.evidence.drop(variable)
+        return self._update(variable)
+
+    def marginal_distributions(self, query: List[str]) -> pd.DataFrame:
+        """
+        Returns the posterior marginal of query variables that share a clique, given the current evidence.
+        """
+        return self.junction_tree.marginal(query).to_dataframe()
+
+    def all_marginals(self) -> Dict[str, pd.DataFrame]:
+        """
+        Returns the posterior marginal of every variable given the current evidence.
+        """
+        return {v: self.junction_tree.marginal([v]).to_dataframe() for v in self.junction_tree.home}
+
+    def probability_of_evidence(self) -> float:
+        """
+        Returns Pr(e) of the current evidence.
+        """
+        return self.junction_tree.probability_of_evidence()
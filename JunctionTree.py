@@ -0,0 +1,185 @@
+from typing import List, Tuple, Optional
+import numpy as np
+import pandas as pd
+import networkx as nx
+from BayesNet import BayesNet
+from Factor import Factor
+
+
+class JunctionTree:
+    """
+    Junction (clique) tree of a BayesNet built from an elimination order. After calibrating with Shafer-Shenoy
+    message passing, the posterior of every variable, or of any set of variables that share a clique, is read off
+    a single clique belief.
+    """
+
+    def __init__(self, bn: BayesNet, order: List[str]) -> None:
+        """
+        :param bn: The network to build the tree for.
+        :param order: Elimination order over all variables of the network, e.g. from BNReasoner.find_order.
+        """
+        self.bn = bn
+        self.cliques = self._triangulate(bn.get_interaction_graph(), order)
+
+        # connect the cliques by a maximum spanning tree on the separator sizes (running intersection property)
+        clique_graph = nx.Graph()
+        clique_graph.add_nodes_from(range(len(self.cliques)))
+        for i in range(len(self.cliques)):
+            for j in range(i + 1, len(self.cliques)):
+                weight = len(set(self.cliques[i]).intersection(self.cliques[j]))
+                clique_graph.add_edge(i, j, weight=weight)
+        self.tree = nx.maximum_spanning_tree(clique_graph)
+
+        # home clique of every variable: the first clique holding its CPT, used for its evidence as well
+        self.home = {}
+        potentials = [Factor(c, np.ones([bn.get_cardinality(v) for v in c])) for c in self.cliques]
+        for variable in bn.get_all_variables():
+            factor = bn.get_factor(variable)
+            i = self.find_clique(factor.variables)
+            self.home[variable] = i
+            potentials[i] = Factor(self.cliques[i], potentials[i].values * factor.expand(self.cliques[i]))
+        self.potentials = potentials
+
+        self.evidence = None
+        self.messages = {}
+        self._beliefs = {}
+        self._marginals = {}
+
+        # number of factor operations of passing every message once
+        self.full_operations = sum(self.operations(i, j) for i, j in self.schedule())
+
+    @staticmethod
+    def _triangulate(interaction_graph: nx.Graph, order: List[str]) -> List[List[str]]:
+        """
+        Eliminates the variables in the given order and returns the maximal cliques of the triangulated graph.
+        """
+        graph = interaction_graph.copy()
+        cliques = []
+        for node in order:
+            neighbours = list(graph.neighbors(node))
+            clique = set(neighbours + [node])
+
+            # fill in missing edges between neighbours
+            for i in range(len(neighbours)):
+                for j in range(i + 1, len(neighbours)):
+                    if not graph.has_edge(neighbours[i], neighbours[j]):
+                        graph.add_edge(neighbours[i], neighbours[j])
+            graph.remove_node(node)
+
+            if not any(clique <= set(other) for other in cliques):
+                cliques.append(sorted(clique))
+
+        return cliques
+
+    def find_clique(self, variables: List[str]) -> Optional[int]:
+        """
+        Returns the index of the smallest clique containing all variables, or None if no clique does.
+        """
+        candidates = [i for i, c in enumerate(self.cliques) if set(variables) <= set(c)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda i: len(self.cliques[i]))
+
+    # MESSAGE PASSING --------------------------------------------------------------------------------------------------
+
+    def evidence_potential(self, i: int) -> Factor:
+        """
+        Returns the potential of clique i with the evidence of the variables at home in it applied.
+        """
+        local = [v for v in self.evidence.index if self.home[v] == i]
+        return self.potentials[i].reduce(self.evidence[local], drop=False)
+
+    def message(self, i: int, j: int) -> Factor:
+        """
+        Computes the message from clique i to its neighbour j out of the messages i received from its other
+        neighbours.
+        """
+        incoming = [self.messages[(k, i)] for k in self.tree.neighbors(i) if k != j]
+        product = Factor.product([self.evidence_potential(i)] + incoming)
+        separator = [v for v in self.cliques[i] if v in self.cliques[j]]
+        return product.sum_out([v for v in self.cliques[i] if v not in separator])
+
+    def operations(self, i: int, j: int) -> int:
+        """
+        Returns the number of factor operations (multiplications and sum-outs) of the message from i to j.
+        """
+        return self.tree.degree(i)
+
+    def schedule(self) -> List[Tuple[int, int]]:
+        """
+        Returns all directed edges of the tree in an order in which every message only depends on earlier ones:
+        first towards clique 0 (collect), then back out (distribute).
+        """
+        collect = [(j, i) for i, j in reversed(list(nx.bfs_edges(self.tree, 0)))]
+        return collect + [(j, i) for i, j in reversed(collect)]
+
+    def calibrate(self, evidence: pd.Series) -> int:
+        """
+        Brings the messages up to date with the given evidence. Only the messages directed away from the home
+        cliques of variables whose evidence changed are recomputed, all other messages are reused.
+
+        :param evidence: a series of assignments as tuples. E.g.: pd.Series({"A": True, "B": False})
+        :return: The number of factor operations performed.
+        """
+        if self.evidence is None:
+            changed = set(range(len(self.cliques)))
+        else:
+            old, new = self.evidence.to_dict(), evidence.to_dict()
+            changed = {self.home[v] for v in set(old) | set(new) if old.get(v) != new.get(v)}
+        self.evidence = evidence
+
+        stale = set()
+        for clique in changed:
+            stale |= set(nx.bfs_edges(self.tree, clique))
+
+        performed = 0
+        for i, j in self.schedule():
+            if (i, j) in stale:
+                self.messages[(i, j)] = self.message(i, j)
+                performed += self.operations(i, j)
+
+        if changed:
+            self._beliefs = {}
+            self._marginals = {}
+        return performed
+
+    def belief(self, i: int) -> Factor:
+        """
+        Returns the belief Pr(C_i ^ e) of clique i, computed on first use after every calibration.
+        """
+        if i not in self._beliefs:
+            incoming = [self.messages[(k, i)] for k in self.tree.neighbors(i)]
+            self._beliefs[i] = Factor.product([self.evidence_potential(i)] + incoming)
+        return self._beliefs[i]
+
+    # QUERIES ----------------------------------------------------------------------------------------------------------
+
+    def joint(self, variables: List[str]) -> Factor:
+        """
+        Returns Pr(variables ^ e) from the belief of a clique containing all variables.
+
+        :raises ValueError: If the variables do not share a clique.
+        """
+        i = self.find_clique(variables)
+        if i is None:
+            raise ValueError('Variables {} do not share a clique.'.format(variables))
+
+        belief = self.belief(i)
+        marginal = belief.sum_out([v for v in belief.variables if v not in variables])
+        return Factor(variables, marginal.expand(variables))
+
+    def marginal(self, variables: List[str]) -> Factor:
+        """
+        Returns the posterior Pr(variables | e) of variables that share a clique, memoised per calibration.
+        """
+        key = tuple(variables)
+        if key not in self._marginals:
+            self._marginals[key] = self.joint(variables).normalize()
+        return self._marginals[key]
+
+    def probability_of_evidence(self) -> float:
+        """
+        Returns Pr(e) for the evidence the tree is calibrated with.
+        """
+        # the clique graph is complete, so the tree is connected and every belief sums to Pr(e)
+        return float(self.belief(0).values.sum())
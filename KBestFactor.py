@@ -0,0 +1,162 @@
+from typing import List, Dict, Tuple, Callable, Optional, Union
+import numpy as np
+from Factor import Factor
+
+# name of the trailing axis that holds the k best values of every instantiation
+RANK = '__rank__'
+
+
+class KBestFactor:
+    """
+    Factor for max-product elimination that keeps, for every instantiation of its scope, the k largest values
+    (sorted in descending order) of the instantiations of the variables maxed-out so far, together with the
+    back-pointers to recover those instantiations by traceback. With k=1 this is plain max-product elimination.
+    Like Factor it can carry a log_scale.
+    """
+
+    def __init__(self, variables: List[str], values: np.ndarray,
+                 traceback: Callable[[Dict[str, int], int], None], log_scale: float = 0.0) -> None:
+        """
+        :param variables: Scope of the factor.
+        :param values: Array with one axis per variable, of the size of its number of states, plus a trailing axis
+            of size k.
+        :param traceback: Function that, given an instantiation containing the scope and a rank, adds the
+            instantiation of the maxed-out variables that led to that value.
+        :param log_scale: Natural logarithm of the scale the values are multiplied with.
+        """
+        self.variables = list(variables)
+        self.values = values
+        self.traceback = traceback
+        self.log_scale = log_scale
+
+    @property
+    def k(self) -> int:
+        return self.values.shape[-1]
+
+    @classmethod
+    def from_factor(cls, factor: Factor, k: int) -> 'KBestFactor':
+        """
+        Wraps a plain factor: its values are the best ones, the other k-1 ranks are 0.
+        """
+        values = np.zeros(factor.values.shape + (k,))
+        values[..., 0] = factor.values
+        return cls(factor.variables, values, lambda instantiation, rank: None, factor.log_scale)
+
+    def expand(self, variables: List[str]) -> np.ndarray:
+        """
+        Returns the values as an array that broadcasts against a factor over 'variables', the rank axis last.
+        """
+        return Factor(self.variables + [RANK], self.values).expand(variables + [RANK])
+
+    def _key(self, instantiation: Dict[str, int], rank: int) -> Tuple[int, ...]:
+        return tuple(instantiation[v] for v in self.variables) + (rank,)
+
+    def multiply(self, other: 'KBestFactor') -> 'KBestFactor':
+        """
+        Given another factor g, compute the k best values of every instantiation of the product h=fg.
+        """
+        k = self.k
+        variables = self.variables + [v for v in other.variables if v not in self.variables]
+
+        # all k x k combinations of ranks, of which the k best are kept
+        combined = self.expand(variables)[..., :, None] * other.expand(variables)[..., None, :]
+        combined = combined.reshape(combined.shape[:-2] + (k * k,))
+        best = np.argsort(-combined, axis=-1, kind='stable')[..., :k]
+        values = np.take_along_axis(combined, best, axis=-1)
+        rank_self, rank_other = np.divmod(best, k)
+
+        product = KBestFactor(variables, values, None, self.log_scale + other.log_scale)
+
+        def traceback(instantiation: Dict[str, int], rank: int) -> None:
+            key = product._key(instantiation, rank)
+            self.traceback(instantiation, int(rank_self[key]))
+            other.traceback(instantiation, int(rank_other[key]))
+
+        product.traceback = traceback
+        return product
+
+    def max_out(self, variable: str) -> 'KBestFactor':
+        """
+        Compute the factor in which the variable is maxed-out, keeping the back-pointers to its value.
+        """
+        k = self.k
+        variables = [v for v in self.variables if v != variable]
+
+        # all states of the variable times k ranks, of which the k best are kept
+        candidates = self.expand(variables + [variable])
+        candidates = candidates.reshape(candidates.shape[:-2] + (candidates.shape[-2] * k,))
+        best = np.argsort(-candidates, axis=-1, kind='stable')[..., :k]
+        values = np.take_along_axis(candidates, best, axis=-1)
+        value, rank_child = np.divmod(best, k)
+
+        result = KBestFactor(variables, values, None, self.log_scale)
+
+        def traceback(instantiation: Dict[str, int], rank: int) -> None:
+            key = result._key(instantiation, rank)
+            instantiation[variable] = int(value[key])
+            self.traceback(instantiation, int(rank_child[key]))
+
+        result.traceback = traceback
+        return result
+
+    def rescale(self) -> 'KBestFactor':
+        """
+        Returns the same factor with its largest value scaled to 1, the scaling moved into log_scale.
+        """
+        largest = self.values.max()
+        if largest <= 0:
+            return self
+        return KBestFactor(self.variables, self.values / largest, self.traceback, self.log_scale + np.log(largest))
+
+    @staticmethod
+    def eliminate(factors: List[Factor], order: List[str], k: int = 1, scaled: bool = False,
+                  cardinalities: Optional[Dict[str, int]] = None) -> List[Tuple[Dict[str, Union[bool, int]], float]]:
+        """
+        Max-product variable elimination with traceback.
+
+        :param factors: Factors whose product is maximised, mentioning no variables outside 'order'.
+        :param order: Elimination order of the variables to maximise over.
+        :param k: Number of instantiations to return.
+        :param scaled: If True every new factor is rescaled and the natural logarithms of the values are returned,
+            so long products do not underflow.
+        :param cardinalities: Number of states of the variables of 'order' that no factor mentions, 2 by default.
+        :return: The k most probable instantiations of 'order' with their values, in descending order. Binary
+            variables take boolean values, the others state indices. Instantiations with value 0 are left out.
+        """
+        cardinalities = dict(cardinalities or {})
+        for f in factors:
+            cardinalities.update(zip(f.variables, f.values.shape))
+        factors = [KBestFactor.from_factor(f, k) for f in factors]
+        for variable in order:
+            tables_variable = [f for f in factors if variable in f.variables]
+            factors = [f for f in factors if variable not in f.variables]
+
+            # a variable no factor mentions can take any value
+            if not tables_variable:
+                uniform = Factor([variable], np.ones(cardinalities.get(variable, 2)))
+                tables_variable = [KBestFactor.from_factor(uniform, k)]
+
+            product = tables_variable[0]
+            for factor in tables_variable[1:]:
+                product = product.multiply(factor)
+            result = product.max_out(variable)
+            factors.append(result.rescale() if scaled else result)
+
+        result = KBestFactor.from_factor(Factor([], np.ones(())), k)
+        for factor in factors:
+            result = result.multiply(factor)
+
+        explanations = []
+        for rank in range(k):
+            if result.values[rank] <= 0:
+                break
+            instantiation = {}
+            result.traceback(instantiation, rank)
+            if scaled:
+                value = float(np.log(result.values[rank]) + result.log_scale)
+            else:
+                value = float(result.values[rank] * np.exp(result.log_scale))
+            explanations.append(({v: bool(instantiation[v]) if cardinalities.get(v, 2) == 2 else instantiation[v]
+                                  for v in order}, value))
+
+        return explanations
@@ -0,0 +1,50 @@
+from typing import List, Optional
+import json
+import os
+
+
+class OrderStore:
+    """
+    JSON file with the best elimination order found per key (network fingerprint and set of eliminated variables),
+    so that later processes can load an order instead of searching again.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Path of the JSON file, created on the first put.
+        """
+        self.path = path
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """
+        Returns the stored order for the key, or None if there is none.
+        """
+        entry = self._read().get(key)
+        return None if entry is None else entry['order']
+
+    def put(self, key: str, order: List[str], cost: int) -> None:
+        """
+        Stores the order for the key, unless an order with a lower or equal cost is already stored.
+        """
+        orders = self._read()
+        if key in orders and orders[key]['cost'] <= cost:
+            return
+        orders[key] = {'order': list(order), 'cost': cost}
+
+        # write to a temporary file first, so readers never see a partially written store
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(orders, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    @staticmethod
+    def key(fingerprint: str, variables: List[str]) -> str:
+        """
+        Returns the key of an ordering of the variables in the network with the given fingerprint.
+        """
+        return fingerprint + ':' + json.dumps(sorted(variables))
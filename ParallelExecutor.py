@@ -0,0 +1,123 @@
+from typing import List, Tuple, Dict, Iterable, Iterator, Optional, Any
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from BayesNet import BayesNet
+from BNReasoner import BNReasoner
+from Factor import Factor
+
+# state of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(shm_name: str, variables: List[str], edges: List[Tuple[str, str]], scopes: List[List[str]],
+                 shapes: List[Tuple[int, ...]], offsets: List[int], states: Dict[str, List[str]],
+                 options: Dict[str, Any]) -> None:
+    """
+    Rebuilds the network in a worker process, with the CPT values as views on the shared memory block instead of
+    copies, and creates the reasoner that answers the queries of this worker.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray((offsets[-1],), dtype=np.float64, buffer=shm.buf)
+    values.flags.writeable = False
+
+    cpts = {}
+    for i, variable in enumerate(variables):
+        cpts[variable] = Factor(scopes[i], values[offsets[i]:offsets[i + 1]].reshape(shapes[i]))
+    bn = BayesNet()
+    bn.create_bn(variables, edges, cpts, states)
+
+    # the block has to stay open as long as the factors use it
+    _worker['shm'] = shm
+    _worker['reasoner'] = BNReasoner(net=bn, **options)
+
+
+def _run_task(task: Tuple[str, List[str], Tuple[Tuple[str, int], ...], int]) -> Any:
+    """
+    Answers one query in a worker process.
+    """
+    kind, query, evidence, k = task
+    reasoner = _worker['reasoner']
+    evidence = pd.Series(dict(evidence), dtype=object)
+    if kind == 'marginal':
+        return reasoner.posterior_factor(query, evidence)
+    return reasoner.MAP(query, evidence, k)
+
+
+class ParallelExecutor:
+    """
+    Answers batches of independent queries on one network in a pool of worker processes. The network is shipped
+    to every worker once: the structure and scopes when the worker starts, the CPT values through one shared
+    memory block that all workers read without copying. Results are streamed back in the order of the queries.
+
+    Use as a context manager, or call close() to stop the workers and free the shared memory.
+    """
+
+    def __init__(self, bn: BayesNet, processes: Optional[int] = None, chunksize: int = 64, **options) -> None:
+        """
+        :param bn: The network to answer the queries on.
+        :param processes: Number of worker processes, by default the number of cores.
+        :param chunksize: Number of queries sent to a worker at once.
+        :param options: Keyword arguments for the BNReasoner of every worker, e.g. order_method or engine.
+        """
+        self.bn = bn
+        variables = bn.get_all_variables()
+        factors = [bn.get_factor(v) for v in variables]
+        offsets = np.cumsum([0] + [f.values.size for f in factors]).tolist()
+
+        # copy all CPT values into one shared block
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offsets[-1], 1) * 8)
+        values = np.ndarray((offsets[-1],), dtype=np.float64, buffer=self.shm.buf)
+        for i, factor in enumerate(factors):
+            values[offsets[i]:offsets[i + 1]] = factor.values.ravel()
+
+        self.chunksize = chunksize
+        self.pool = multiprocessing.Pool(
+            processes, _init_worker,
+            (self.shm.name, variables, list(bn.structure.edges), [f.variables for f in factors],
+             [f.values.shape for f in factors], offsets, {v: bn.get_states(v) for v in variables}, options))
+
+    def run(self, tasks: Iterable[Tuple[str, List[str], pd.Series, int]]) -> Iterator[Any]:
+        """
+        Answers a stream of queries in parallel.
+
+        :param tasks: (kind, query, evidence, k) tuples, kind being 'marginal' for marginal_distributions or 'MAP'.
+        :return: Iterator over the results in the order of the tasks: the posterior as a Factor for 'marginal'
+            tasks and the DataFrame of the k best instantiations for 'MAP' tasks.
+        """
+        def encode(evidence: pd.Series) -> Tuple[Tuple[str, int], ...]:
+            return tuple((v, int(value)) for v, value in self.bn.encode_instantiation(evidence).items())
+
+        # evidence as plain tuples of state indices, which pickle much smaller than Series; state names are encoded
+        # and invalid states rejected here, before the tasks are sent
+        tasks = ((kind, list(query), encode(evidence), k) for kind, query, evidence, k in tasks)
+        return self.pool.imap(_run_task, tasks, self.chunksize)
+
+    def marginal_distributions(self, queries: Iterable[Tuple[List[str], pd.Series]]) -> Iterator[pd.DataFrame]:
+        """
+        Computes the posterior marginal of every (query, evidence) pair, see BNReasoner.marginal_distributions.
+        """
+        for factor in self.run(('marginal', query, evidence, 1) for query, evidence in queries):
+            yield factor.to_dataframe()
+
+    def MAP(self, queries: Iterable[Tuple[List[str], pd.Series]], k: int = 1) -> Iterator[pd.DataFrame]:
+        """
+        Computes the k most probable instantiations of every (query, evidence) pair, see BNReasoner.MAP.
+        """
+        return self.run(('MAP', query, evidence, k) for query, evidence in queries)
+
+    def close(self) -> None:
+        """
+        Stops the worker processes and frees the shared memory.
+        """
+        self.pool.close()
+        self.pool.join()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> 'ParallelExecutor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,298 @@
+from typing import List, Dict, Tuple, Optional
+import math
+from collections import OrderedDict
+from concurrent.futures import Executor, wait, FIRST_COMPLETED
+import time
+import numpy as np
+import pandas as pd
+from BayesNet import BayesNet
+from Factor import Factor
+from SparseFactor import SparseFactor
+from Tracer import Tracer
+
+# name of the leading axis that holds the rows of batched evidence
+BATCH = '__batch__'
+
+
+class MemoryBudgetError(MemoryError):
+    """
+    Raised when a variable elimination would build a factor larger than the memory budget.
+    """
+
+    def __init__(self, variables: List[str], cells: int, budget: int) -> None:
+        """
+        :param variables: Scope of the offending factor.
+        :param cells: Number of cells of the offending factor.
+        :param budget: The memory budget in bytes.
+        """
+        super().__init__('Variable elimination needs a factor over {} of {} cells ({} bytes), more than the memory '
+                         'budget of {} bytes.'.format(variables, cells, cells * 8, budget))
+        self.variables = variables
+        self.cells = cells
+        self.budget = budget
+
+
+class QueryPlan:
+    """
+    Reusable variable elimination plan for one (query variables, evidence variable names) signature.
+    Executing a plan only touches the factors of the network, all graph work is done when the plan is compiled.
+    """
+
+    def __init__(self, query: List[str], evidence_vars: List[str], variables: List[str], order: List[str],
+                 scopes: List[List[str]], cardinalities: Optional[Dict[str, int]] = None) -> None:
+        """
+        :param query: Query variables, in the order of the axes of the resulting factor.
+        :param evidence_vars: Names of the evidence variables.
+        :param variables: Variables whose CPTs take part in the elimination (the pruned variable set).
+        :param order: Elimination order of the non-query variables.
+        :param scopes: Scope of the CPT of every variable in 'variables'.
+        :param cardinalities: Number of states of the variables in the scopes, 2 for the variables left out.
+        """
+        self.query = list(query)
+        self.evidence_vars = sorted(evidence_vars)
+        self.variables = list(variables)
+        self.order = list(order)
+        self.cardinalities = dict(cardinalities or {})
+
+        # evidence outside the query is sliced out, evidence on query variables zeroes incompatible entries
+        self.sliced = [v for v in self.evidence_vars if v not in self.query]
+        self.kept = [v for v in self.evidence_vars if v in self.query]
+
+        # scope of the largest factor the plan builds, known before running it
+        self.widest = []
+        self.schedule, self.final = self._build_schedule(scopes)
+
+    def _build_schedule(self, scopes: List[List[str]]) -> Tuple[List[Tuple[str, List[int], int]], List[int]]:
+        """
+        Simulates the elimination on the scopes of the factors. Slot i < len(variables) holds the reduced CPT of
+        variables[i], every step of the schedule multiplies its input slots, sums out its variable and writes the
+        result to the next free slot. Along the way the widest factor is kept in self.widest.
+
+        :param scopes: Scopes of the CPTs of the variables.
+        :return: The schedule as (variable, input slots, output slot) tuples and the slots left at the end.
+        """
+        scopes = [set(scope) - set(self.sliced) for scope in scopes]
+        live = list(range(len(scopes)))
+        schedule = []
+        for scope in scopes:
+            self._update_widest(scope)
+
+        for variable in self.order:
+            inputs = [i for i in live if variable in scopes[i]]
+
+            # evidence variables have already been sliced out
+            if not inputs:
+                continue
+
+            product = set.union(*[scopes[i] for i in inputs])
+            self._update_widest(product)
+            scopes.append(product - {variable})
+            live = [i for i in live if i not in inputs] + [len(scopes) - 1]
+            schedule.append((variable, inputs, len(scopes) - 1))
+
+        self._update_widest(set.union(set(self.query), *[scopes[i] for i in live]))
+        return schedule, live
+
+    def _cells(self, scope) -> int:
+        return math.prod(self.cardinalities.get(v, 2) for v in scope)
+
+    def _update_widest(self, scope: set) -> None:
+        if not self.widest or self._cells(scope) > self._cells(self.widest):
+            self.widest = sorted(scope)
+
+    @property
+    def peak_cells(self) -> int:
+        """
+        Number of cells of the largest factor the plan builds for one evidence instantiation.
+        """
+        return self._cells(self.widest)
+
+    def run_schedule(self, factors: List[Factor], executor: Optional[Executor] = None,
+                     sparse_threshold: float = 0.0, scaled: bool = False,
+                     tracer: Optional[Tracer] = None) -> List[Factor]:
+        """
+        Runs the multiply/sum-out steps of the schedule on the reduced CPTs. Without an executor the steps run one
+        after another. With an executor every step is submitted as soon as the steps producing its inputs have
+        finished, so independent branches of the elimination tree (e.g. disconnected components) run concurrently;
+        numpy releases the GIL in the products and sums of large factors, so a thread pool works.
+
+        :param factors: The reduced CPTs, one per variable of the plan.
+        :param executor: Executor to run the steps on, e.g. a concurrent.futures.ThreadPoolExecutor.
+        :param sparse_threshold: Factors with at most this fraction of nonzero entries are kept as SparseFactors,
+            0 to keep all factors dense.
+        :param scaled: If True every new factor is rescaled, so long products do not underflow.
+        :param tracer: Tracer that records the duration of every multiplication and sum-out and the factor sizes.
+        :return: The factors of all slots.
+        """
+        def step(variable: str, inputs: List[int]) -> Factor:
+            if tracer is None:
+                result = Factor.product([factors[i] for i in inputs]).sum_out(variable)
+            else:
+                with tracer.operation('multiply'):
+                    product = Factor.product([factors[i] for i in inputs])
+                tracer.factor(product)
+                with tracer.operation('sum_out'):
+                    result = product.sum_out(variable)
+            if scaled:
+                result = result.rescale()
+            return SparseFactor.select(result, sparse_threshold) if sparse_threshold > 0 else result
+
+        if sparse_threshold > 0:
+            factors = [SparseFactor.select(f, sparse_threshold) for f in factors]
+
+        factors = factors + [None] * len(self.schedule)
+        if executor is None:
+            for variable, inputs, output in self.schedule:
+                factors[output] = step(variable, inputs)
+            return factors
+
+        # number of unfinished inputs of every step, and the steps waiting for every slot
+        offset = len(self.variables)
+        pending = [sum(i >= offset for i in inputs) for _, inputs, _ in self.schedule]
+        consumer = {i: s for s, (_, inputs, _) in enumerate(self.schedule) for i in inputs}
+
+        running = {}
+        for s, (variable, inputs, output) in enumerate(self.schedule):
+            if pending[s] == 0:
+                running[executor.submit(step, variable, inputs)] = output
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                output = running.pop(future)
+                factors[output] = future.result()
+
+                # every slot is the input of at most one later step
+                s = consumer.get(output)
+                if s is not None:
+                    pending[s] -= 1
+                    if pending[s] == 0:
+                        variable, inputs, next_output = self.schedule[s]
+                        running[executor.submit(step, variable, inputs)] = next_output
+
+        return factors
+
+    def execute(self, bn: BayesNet, evidence: pd.Series, executor: Optional[Executor] = None,
+                sparse_threshold: float = 0.0, scaled: bool = False, tracer: Optional[Tracer] = None) -> Factor:
+        """
+        Runs the plan with the given evidence values.
+
+        :param bn: The network the plan was compiled for.
+        :param evidence: a series of assignments as tuples, over exactly the evidence variables of the plan.
+        :param executor: Executor to run independent elimination steps on concurrently, see run_schedule.
+        :param sparse_threshold: Density up to which factors are stored sparsely, see run_schedule.
+        :param scaled: If True the factors are rescaled after every step and the result carries a log_scale.
+        :param tracer: Tracer that records the operations of the execution, see run_schedule.
+        :return: Pr(Q ^ e) as a Factor over the query variables.
+        """
+        if sorted(evidence.index) != self.evidence_vars:
+            raise ValueError('Evidence {} does not match the plan for {}.'.format(list(evidence.index),
+                                                                                  self.evidence_vars))
+        sliced = evidence[self.sliced]
+        kept = evidence[self.kept]
+
+        start = time.perf_counter()
+        factors = [bn.get_factor(v).reduce(sliced).reduce(kept, drop=False) for v in self.variables]
+        if tracer is not None:
+            tracer.add_operation('reduce', start, time.perf_counter() - start)
+        if scaled:
+            factors = [f.rescale() for f in factors]
+        factors = self.run_schedule(factors, executor, sparse_threshold, scaled, tracer)
+
+        product = Factor.product([factors[i] for i in self.final])
+        if isinstance(product, SparseFactor):
+            product = product.to_factor()
+        if scaled:
+            product = product.rescale()
+        return Factor(self.query, product.expand(self.query), product.log_scale)
+
+    def execute_batch(self, bn: BayesNet, evidence: pd.DataFrame, executor: Optional[Executor] = None,
+                      tracer: Optional[Tracer] = None) -> Factor:
+        """
+        Runs the plan once for N evidence instantiations, carrying a leading batch axis on every factor that
+        mentions evidence.
+
+        :param bn: The network the plan was compiled for.
+        :param evidence: DataFrame with one instantiation per row, over exactly the evidence variables of the plan.
+        :param executor: Executor to run independent elimination steps on concurrently, see run_schedule.
+        :param tracer: Tracer that records the operations of the execution, see run_schedule.
+        :return: Pr(Q ^ e) for every row as a Factor over [BATCH] + query variables.
+        """
+        if sorted(evidence.columns) != self.evidence_vars:
+            raise ValueError('Evidence {} does not match the plan for {}.'.format(list(evidence.columns),
+                                                                                  self.evidence_vars))
+        sliced = evidence[self.sliced]
+
+        start = time.perf_counter()
+        factors = [bn.get_factor(v).reduce_batch(sliced, BATCH) for v in self.variables]
+        if tracer is not None:
+            tracer.add_operation('reduce', start, time.perf_counter() - start)
+        factors = self.run_schedule(factors, executor, tracer=tracer)
+
+        # evidence on query variables zeroes the incompatible instantiations of every row
+        indicators = []
+        for variable in self.kept:
+            indicator = np.zeros((len(evidence), bn.get_cardinality(variable)))
+            indicator[np.arange(len(evidence)), evidence[variable].to_numpy().astype(int)] = 1.0
+            indicators.append(Factor([BATCH, variable], indicator))
+
+        product = Factor.product([factors[i] for i in self.final] + indicators)
+
+        # rows whose evidence is irrelevant to the query share a size 1 batch axis
+        variables = [BATCH] + self.query
+        values = product.expand(variables)
+        return Factor(variables, np.broadcast_to(values, (len(evidence),) + values.shape[1:]))
+
+    @staticmethod
+    def signature(query: List[str], evidence_vars: List[str]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """
+        Returns the key under which plans are cached.
+        """
+        return tuple(query), tuple(sorted(evidence_vars))
+
+
+class PlanCache:
+    """
+    Bounded least-recently-used cache of compiled query plans with hit/miss counters.
+    """
+
+    def __init__(self, maxsize: int = 128) -> None:
+        """
+        :param maxsize: Maximum number of plans kept, 0 disables caching.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+
+    def get(self, key: Tuple) -> Optional[QueryPlan]:
+        """
+        Returns the cached plan for the key and marks it as most recently used, or None on a miss.
+        """
+        plan = self._plans.get(key)
+        if plan is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._plans.move_to_end(key)
+        return plan
+
+    def put(self, key: Tuple, plan: QueryPlan) -> None:
+        """
+        Stores a plan, evicting the least recently used one when the cache is full.
+        """
+        if self.maxsize <= 0:
+            return
+        self._plans[key] = plan
+        self._plans.move_to_end(key)
+        while len(self._plans) > self.maxsize:
+            self._plans.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drops all plans, needed after the structure of the network changes.
+        """
+        self._plans.clear()
+
+    def __len__(self) -> int:
+        return len(self._plans)
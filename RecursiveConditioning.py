@@ -0,0 +1,241 @@
+from typing import List, Dict, Optional
+import heapq
+import itertools
+import math
+import numpy as np
+import pandas as pd
+from BayesNet import BayesNet
+from Factor import Factor
+
+
+class DtreeNode:
+    """
+    Node of a decomposition tree: a leaf holds one CPT, an internal node splits its CPTs into two subtrees.
+    """
+
+    def __init__(self, factor: Optional[Factor] = None, left: 'DtreeNode' = None, right: 'DtreeNode' = None) -> None:
+        self.factor = factor
+        self.left = left
+        self.right = right
+        self.variables = set(factor.variables) if factor is not None else left.variables | right.variables
+
+        # set by RecursiveConditioning: variables to condition on, the variables instantiated by the ancestors, the
+        # key variables of the cache and the number of entries the cache may hold
+        self.cutset = []
+        self.context = []
+        self.key = []
+        self.capacity = 0
+        self.cache = {}
+
+    @property
+    def leaf(self) -> bool:
+        return self.factor is not None
+
+
+class RecursiveConditioning:
+    """
+    Recursive conditioning on a decomposition tree (dtree) of the CPTs of a BayesNet. Every internal node
+    conditions on its cutset, the variables shared by its two subtrees that no ancestor conditions on, after which
+    the subtrees are independent and are solved recursively. Without a cache this runs in space linear in the
+    network; caching the result of every node per instantiation of its context turns it into elimination-level
+    time. The cache_size knob sets any point in between.
+    """
+
+    def __init__(self, bn: BayesNet, order: List[str], cache_size: Optional[int] = None) -> None:
+        """
+        :param bn: The network to reason on.
+        :param order: Elimination order of all variables, from which the dtree is built.
+        :param cache_size: Maximum number of cached results over all nodes, None for no limit and 0 for no cache.
+        """
+        self.bn = bn
+        self.cache_size = cache_size
+        self.cardinality = {v: bn.get_cardinality(v) for v in bn.get_all_variables()}
+        self.root = self._build_dtree([bn.get_factor(v) for v in bn.get_all_variables()], order)
+        self._assign_cutsets(self.root, set())
+        self._allocate_cache()
+
+        self.calls = 0
+        self.cache_hits = 0
+
+    @staticmethod
+    def _build_dtree(factors: List[Factor], order: List[str]) -> DtreeNode:
+        """
+        Builds a dtree from an elimination order: eliminating a variable joins all trees that mention it, so the
+        width of the dtree follows the width of the order.
+        """
+        def compose(trees: List[DtreeNode]) -> DtreeNode:
+            # balanced, so the depth of the recursion stays logarithmic in the number of joined trees
+            while len(trees) > 1:
+                trees = [DtreeNode(left=trees[i], right=trees[i + 1]) if i + 1 < len(trees) else trees[i]
+                         for i in range(0, len(trees), 2)]
+            return trees[0]
+
+        trees = [DtreeNode(factor=f) for f in factors]
+        for variable in order:
+            joined = [t for t in trees if variable in t.variables]
+            if len(joined) > 1:
+                trees = [t for t in trees if variable not in t.variables] + [compose(joined)]
+        return compose(trees)
+
+    def _assign_cutsets(self, node: DtreeNode, acutset: set) -> None:
+        """
+        Sets the cutset of every internal node and the variables its cache is keyed on: the variables of the
+        subtree that are instantiated when the node is reached, i.e. its context plus any evidence.
+        """
+        if node.leaf:
+            return
+        node.cutset = sorted((node.left.variables & node.right.variables) - acutset)
+        node.context = sorted(node.variables & acutset)
+        node.key = sorted(node.variables)
+        self._assign_cutsets(node.left, acutset | set(node.cutset))
+        self._assign_cutsets(node.right, acutset | set(node.cutset))
+
+    def _internal_nodes(self) -> List[DtreeNode]:
+        """
+        Returns the internal nodes breadth first, i.e. from the root down.
+        """
+        nodes = [self.root] if not self.root.leaf else []
+        for node in nodes:
+            nodes += [child for child in (node.left, node.right) if not child.leaf]
+        return nodes
+
+    def _instantiations(self, variables: List[str]) -> int:
+        return math.prod(self.cardinality[v] for v in variables)
+
+    def _allocate_cache(self) -> None:
+        """
+        Divides cache_size over the nodes. A node is cached completely, one entry per instantiation of its context,
+        or not at all. Nodes are picked greedily by the number of recursive calls their cache saves per entry.
+
+        Ignoring evidence, a node is called at least once per instantiation of its context, so a cached node makes
+        exactly one call to its subtree per instantiation of its context and the calls in a subtree are linear in
+        the calls made to it: calls * coefficient + the calls below the cached nodes. Caching a node only changes
+        the calls of the nodes below it and the coefficients of the nodes above it, which are updated in place.
+        """
+        nodes = self._internal_nodes()
+        size = {node: self._instantiations(node.context) for node in nodes}
+        if self.cache_size is None or self.cache_size >= sum(size.values()):
+            for node in nodes:
+                node.capacity = size[node]
+            return
+
+        # calls of every node from the root down and the coefficient of every subtree from the leaves up
+        cut = {node: self._instantiations(node.cutset) for node in nodes}
+        parent = {child: node for node in nodes for child in (node.left, node.right)}
+        calls = {self.root: 1}
+        for node in nodes:
+            calls[node.left] = calls[node.right] = calls[node] * cut[node]
+        coefficient = {}
+        for node in reversed(nodes):
+            coefficient[node] = 1 + cut[node] * (coefficient.get(node.left, 1) + coefficient.get(node.right, 1))
+
+        def saved(node: DtreeNode) -> int:
+            return ((calls[node] - size[node]) * cut[node] *
+                    (coefficient.get(node.left, 1) + coefficient.get(node.right, 1)))
+
+        # savings only decrease as nodes get cached, so outdated heap entries are pushed again with their new value
+        position = {node: i for i, node in enumerate(nodes)}
+        heap = [(-saved(node) / size[node], position[node], saved(node)) for node in nodes]
+        heapq.heapify(heap)
+        remaining = self.cache_size
+        while heap:
+            _, i, value = heapq.heappop(heap)
+            node = nodes[i]
+            if node.capacity or size[node] > remaining or value <= 0:
+                continue
+            if value != saved(node):
+                heapq.heappush(heap, (-saved(node) / size[node], i, saved(node)))
+                continue
+
+            node.capacity = size[node]
+            remaining -= size[node]
+
+            # fewer calls below the node, down to the next cached nodes
+            coefficient[node] = 1
+            stack = [(child, size[node] * cut[node]) for child in (node.left, node.right)]
+            while stack:
+                child, child_calls = stack.pop()
+                calls[child] = child_calls
+                if not child.leaf and not child.capacity:
+                    heapq.heappush(heap, (-saved(child) / size[child], position[child], saved(child)))
+                    stack += [(grandchild, child_calls * cut[child]) for grandchild in (child.left, child.right)]
+
+            # smaller subtrees above the node, up to the next cached node
+            ancestor = parent.get(node)
+            while ancestor is not None and not ancestor.capacity:
+                coefficient[ancestor] = 1 + cut[ancestor] * (coefficient.get(ancestor.left, 1) +
+                                                             coefficient.get(ancestor.right, 1))
+                heapq.heappush(heap, (-saved(ancestor) / size[ancestor], position[ancestor], saved(ancestor)))
+                ancestor = parent.get(ancestor)
+
+    # INFERENCE --------------------------------------------------------------------------------------------------------
+
+    def _recurse(self, node: DtreeNode, instantiation: Dict[str, int]) -> float:
+        """
+        Returns the sum over the uninstantiated variables of the subtree of the product of its CPTs.
+        """
+        self.calls += 1
+        if node.leaf:
+            index = tuple(instantiation.get(v, slice(None)) for v in node.factor.variables)
+            return float(np.sum(node.factor.values[index]))
+
+        key = tuple(instantiation.get(v, -1) for v in node.key) if node.capacity else None
+        if key in node.cache:
+            self.cache_hits += 1
+            return node.cache[key]
+
+        free = [v for v in node.cutset if v not in instantiation]
+        total = 0.0
+        for values in itertools.product(*[range(self.cardinality[v]) for v in free]):
+            instantiation.update(zip(free, values))
+            left = self._recurse(node.left, instantiation)
+            if left != 0:
+                total += left * self._recurse(node.right, instantiation)
+        for v in free:
+            del instantiation[v]
+
+        if node.capacity:
+            # entries of other evidence can fill the cache, the oldest one makes room
+            if len(node.cache) >= node.capacity:
+                del node.cache[next(iter(node.cache))]
+            node.cache[key] = total
+        return total
+
+    def probability(self, instantiation: pd.Series) -> float:
+        """
+        Returns the probability of a (partial) instantiation of the variables, e.g. Pr(e).
+
+        :param instantiation: a series of assignments as tuples. E.g.: pd.Series({"A": True, "B": False})
+        """
+        return self._recurse(self.root, {v: int(value) for v, value in instantiation.items()})
+
+    def joint(self, query: List[str], evidence: pd.Series) -> Factor:
+        """
+        Returns Pr(Q ^ e) as a Factor, with one recursion per instantiation of the query. The cache is shared by
+        all of them.
+        """
+        shape = [self.cardinality[q] for q in query]
+        values = np.zeros(shape)
+        for world in itertools.product(*[range(n) for n in shape]):
+            instantiation = {v: int(value) for v, value in evidence.items()}
+
+            # evidence on a query variable rules out the instantiations that contradict it
+            if any(instantiation.get(q, x) != x for q, x in zip(query, world)):
+                continue
+            instantiation.update(zip(query, world))
+            values[world] = self._recurse(self.root, instantiation)
+        return Factor(query, values)
+
+    @property
+    def cached(self) -> int:
+        """
+        Number of results currently cached.
+        """
+        return sum(len(node.cache) for node in self._internal_nodes())
+
+    def clear_cache(self) -> None:
+        """
+        Drops all cached results.
+        """
+        for node in self._internal_nodes():
+            node.cache = {}
@@ -0,0 +1,188 @@
+from typing import List, Tuple, Optional
+import time
+import numpy as np
+import pandas as pd
+import networkx as nx
+from BayesNet import BayesNet
+from Factor import Factor
+
+
+class Sampler:
+    """
+    Approximate inference by sampling, for networks too large for exact elimination. Every method draws a whole
+    batch of samples per array operation, visiting the variables in topological order.
+        'logic': forward (logic) sampling, rejecting the samples that contradict the evidence
+        'lw': likelihood weighting, clamping the evidence and weighting by its likelihood
+        'gibbs': Gibbs sampling with a number of chains run side by side
+    """
+
+    METHODS = ('logic', 'lw', 'gibbs')
+
+    def __init__(self, bn: BayesNet, seed: Optional[int] = None) -> None:
+        """
+        :param bn: The network to sample from.
+        :param seed: Seed of the random number generator, for reproducible estimates.
+        """
+        self.bn = bn
+        self.rng = np.random.default_rng(seed)
+
+        self.order = list(nx.topological_sort(bn.structure))
+        self.index = {v: i for i, v in enumerate(self.order)}
+
+        # CPT of every variable with its parents first and the variable itself as the last axis
+        self.parents = {}
+        self.tables = {}
+        for v in self.order:
+            factor = bn.get_factor(v)
+            self.parents[v] = [u for u in factor.variables if u != v]
+            self.tables[v] = factor.expand(self.parents[v] + [v])
+        self.cardinality = {v: self.tables[v].shape[-1] for v in self.order}
+        self.children = {v: [c for c in self.order if v in self.parents[c]] for v in self.order}
+
+    # SAMPLING ---------------------------------------------------------------------------------------------------------
+
+    def conditional(self, variable: str, samples: np.ndarray) -> np.ndarray:
+        """
+        Returns Pr(variable | parents) for the parent values of every sample, as an array of shape
+        (n, number of states).
+        """
+        index = tuple(samples[:, self.index[p]] for p in self.parents[variable])
+        return np.broadcast_to(self.tables[variable][index], (len(samples), self.cardinality[variable]))
+
+    def draw(self, probs: np.ndarray) -> np.ndarray:
+        """
+        Draws one state per row of unnormalized probabilities: the largest state whose tail sum exceeds a uniform
+        fraction of the row sum. For binary variables this is state 1 with probability p1 / (p0 + p1).
+        """
+        tails = np.cumsum(probs[:, ::-1], axis=1)[:, ::-1]
+        threshold = self.rng.random(len(probs)) * tails[:, 0]
+        return (tails[:, 1:] > threshold[:, None]).sum(axis=1)
+
+    def forward(self, n: int, evidence: pd.Series, clamp: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Draws n samples in topological order.
+
+        :param clamp: If True the evidence variables are set to their observed value and every sample is weighted
+            by the likelihood of the evidence (likelihood weighting), otherwise all variables are sampled and the
+            weight is 1 for samples consistent with the evidence and 0 for the others (logic sampling).
+        :return: The samples as an (n, number of variables) array of values and the weight of every sample.
+        """
+        samples = np.zeros((n, len(self.order)), dtype=np.intp)
+        weights = np.ones(n)
+        for v in self.order:
+            probs = self.conditional(v, samples)
+            i = self.index[v]
+            if clamp and v in evidence.index:
+                value = int(evidence[v])
+                samples[:, i] = value
+                weights *= probs[:, value]
+            else:
+                samples[:, i] = self.draw(probs)
+
+        if not clamp:
+            for v, value in evidence.items():
+                weights *= samples[:, self.index[v]] == int(value)
+        return samples, weights
+
+    def gibbs_sweep(self, samples: np.ndarray, evidence: pd.Series) -> None:
+        """
+        Resamples every non-evidence variable of every chain in place from its distribution given its Markov
+        blanket.
+        """
+        for v in self.order:
+            if v in evidence.index:
+                continue
+            i = self.index[v]
+
+            # Pr(v | parents) * prod over the children of Pr(child | its parents), for every state of v
+            blanket = np.empty((len(samples), self.cardinality[v]))
+            for value in range(self.cardinality[v]):
+                samples[:, i] = value
+                probs = self.conditional(v, samples)[:, value]
+                for child in self.children[v]:
+                    probs = probs * self.conditional(child, samples)[np.arange(len(samples)),
+                                                                     samples[:, self.index[child]]]
+                blanket[:, value] = probs
+
+            samples[:, i] = self.draw(blanket)
+
+    def states(self, samples: np.ndarray, query: List[str]) -> np.ndarray:
+        """
+        Returns the flat index of the instantiation of the query in every sample.
+        """
+        columns = tuple(samples[:, self.index[q]] for q in query)
+        shape = [self.cardinality[q] for q in query]
+        return np.ravel_multi_index(columns, shape) if query else np.zeros(len(samples), dtype=np.intp)
+
+    # ESTIMATION -------------------------------------------------------------------------------------------------------
+
+    def estimate(self, query: List[str], evidence: pd.Series, method: str = 'lw', n_samples: int = 10000,
+                 target_se: Optional[float] = None, time_limit: Optional[float] = None, batch_size: int = 1000,
+                 chains: int = 100, burn_in: int = 100) -> Tuple[Factor, Factor, int]:
+        """
+        Anytime estimate of Pr(Q | e). Samples are drawn in batches until n_samples have been drawn, the largest
+        standard error drops to target_se or time_limit seconds have passed, whichever comes first.
+
+        :param method: 'logic', 'lw' or 'gibbs'.
+        :param chains: Number of Gibbs chains run side by side.
+        :param burn_in: Number of Gibbs sweeps discarded at the start.
+        :return: The estimated posterior, the standard error of every entry, and the number of samples drawn.
+        """
+        if method not in self.METHODS:
+            raise ValueError('Unknown sampling method {}.'.format(method))
+        start = time.perf_counter()
+        shape = tuple(self.cardinality[q] for q in query)
+        n_states = int(np.prod(shape, dtype=np.int64))
+
+        if method == 'gibbs':
+            # start every chain from a likelihood weighting sample
+            samples, _ = self.forward(chains, evidence, clamp=True)
+            for _ in range(burn_in):
+                self.gibbs_sweep(samples, evidence)
+            counts = np.zeros((chains, n_states))
+        else:
+            # weighted sums for the ratio estimator and its variance
+            weight_sum, weight_sq_sum = 0.0, 0.0
+            state_weights, state_weights_sq = np.zeros(n_states), np.zeros(n_states)
+
+        drawn = 0
+        while True:
+            if method == 'gibbs':
+                for _ in range(max(1, batch_size // chains)):
+                    self.gibbs_sweep(samples, evidence)
+                    states = self.states(samples, query)
+                    counts[np.arange(chains), states] += 1
+                    drawn += chains
+                chain_means = counts / counts.sum(axis=1, keepdims=True)
+                estimate = chain_means.mean(axis=0)
+                se = chain_means.std(axis=0, ddof=1) / np.sqrt(chains) if chains > 1 else np.full(n_states, np.inf)
+            else:
+                samples, weights = self.forward(batch_size, evidence, clamp=(method == 'lw'))
+                states = self.states(samples, query)
+                weight_sum += weights.sum()
+                weight_sq_sum += (weights ** 2).sum()
+                state_weights += np.bincount(states, weights, minlength=n_states)
+                state_weights_sq += np.bincount(states, weights ** 2, minlength=n_states)
+                drawn += batch_size
+
+                if weight_sum > 0:
+                    estimate = state_weights / weight_sum
+                    variance = (state_weights_sq * (1 - 2 * estimate) + estimate ** 2 * weight_sq_sum) / weight_sum ** 2
+                    se = np.sqrt(np.maximum(variance, 0))
+                else:
+                    estimate = np.full(n_states, np.nan)
+                    se = np.full(n_states, np.inf)
+
+            if drawn >= n_samples:
+                break
+            if target_se is not None and se.max() <= target_se:
+                break
+            if time_limit is not None and time.perf_counter() - start >= time_limit:
+                break
+
+        if method != 'gibbs' and weight_sum == 0:
+            if method == 'logic':
+                raise ValueError('All {} logic samples contradict the evidence, which is too unlikely for rejection '
+                                 "sampling; use likelihood weighting ('lw') instead.".format(drawn))
+            raise ValueError('All {} samples have weight 0, the evidence has probability 0.'.format(drawn))
+        return Factor(query, estimate.reshape(shape)), Factor(query, se.reshape(shape)), drawn
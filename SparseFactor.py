@@ -0,0 +1,206 @@
+from typing import List, Union, Optional, Sequence
+import numpy as np
+import pandas as pd
+from Factor import Factor, state_dtype
+
+
+class SparseFactor:
+    """
+    Sparse factor over discrete variables that only stores its nonzero entries, in coordinate format: one row of
+    state indices per entry plus the value of that entry. Multiplying and summing out only visit the stored
+    entries, which pays off for deterministic CPTs and for factors zeroed by evidence. Like Factor it can carry a
+    log_scale.
+    """
+
+    def __init__(self, variables: List[str], coordinates: np.ndarray, values: np.ndarray,
+                 log_scale: float = 0.0, shape: Optional[Sequence[int]] = None) -> None:
+        """
+        :param variables: Scope of the factor, one column of 'coordinates' per variable.
+        :param coordinates: (entries, variables) array with the instantiation of every stored entry.
+        :param values: Value of every stored entry.
+        :param log_scale: Natural logarithm of the scale the values are multiplied with.
+        :param shape: Number of states of every variable, all 2 by default.
+        """
+        if len(set(variables)) != len(variables):
+            raise ValueError('Factor has duplicate variables {}.'.format(variables))
+
+        self.variables = list(variables)
+        self.shape = tuple(int(n) for n in shape) if shape is not None else (2,) * len(variables)
+        self.coordinates = np.asarray(coordinates, dtype=state_dtype(max(self.shape, default=2))).reshape(
+            len(values), len(variables))
+        self.values = np.asarray(values, dtype=np.float64)
+        self.log_scale = log_scale
+
+    # CONVERSION -------------------------------------------------------------------------------------------------------
+
+    @classmethod
+    def from_factor(cls, factor: Factor) -> 'SparseFactor':
+        """
+        Builds the sparse representation of a dense factor, leaving out its zero entries.
+        """
+        flat = factor.values.ravel()
+        entries = np.flatnonzero(flat)
+        return cls(factor.variables, cls._decode(entries, factor.values.shape), flat[entries], factor.log_scale,
+                   factor.values.shape)
+
+    def to_factor(self) -> Factor:
+        """
+        Converts the factor to a dense Factor.
+        """
+        values = np.zeros(int(np.prod(self.shape, dtype=np.int64)))
+        values[self._keys(self.variables)] = self.values
+        return Factor(self.variables, values.reshape(self.shape), self.log_scale)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Converts the factor to the DataFrame representation, with all instantiations as rows.
+        """
+        return self.to_factor().to_dataframe()
+
+    @property
+    def density(self) -> float:
+        """
+        Fraction of the instantiations of the scope that is stored.
+        """
+        return len(self.values) / np.prod(self.shape, dtype=np.float64)
+
+    # FACTOR OPERATIONS ------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _decode(keys: np.ndarray, shape: Sequence[int]) -> np.ndarray:
+        """
+        Decodes flat indices into a dense factor of the given shape back into one row of state indices per key.
+        """
+        if not len(shape):
+            return np.zeros((len(keys), 0), dtype=np.int64)
+        return np.stack(np.unravel_index(keys, shape), axis=1)
+
+    def _keys(self, variables: List[str]) -> np.ndarray:
+        """
+        Encodes the instantiation of the given variables of every entry as one integer, its flat index in a dense
+        factor over 'variables'.
+        """
+        keys = np.zeros(len(self.values), dtype=np.int64)
+        for v in variables:
+            i = self.variables.index(v)
+            keys = keys * self.shape[i] + self.coordinates[:, i]
+        return keys
+
+    def multiply(self, other: Union[Factor, 'SparseFactor']) -> 'SparseFactor':
+        """
+        Given another (dense or sparse) factor g, compute the multiplied factor h=fg by joining the entries of
+        both factors that agree on the shared variables.
+
+        :param other: Factor to multiply with.
+        :return: The product over the union of both scopes, as a sparse factor.
+        """
+        if isinstance(other, Factor):
+            other = SparseFactor.from_factor(other)
+        shared = [v for v in self.variables if v in other.variables]
+        extra = [other.variables.index(v) for v in other.variables if v not in self.variables]
+
+        # for every entry of self, the range of entries of other with the same shared instantiation
+        other_order = np.argsort(other._keys(shared), kind='stable')
+        other_keys = other._keys(shared)[other_order]
+        self_keys = self._keys(shared)
+        start = np.searchsorted(other_keys, self_keys, side='left')
+        counts = np.searchsorted(other_keys, self_keys, side='right') - start
+
+        left = np.repeat(np.arange(len(self.values)), counts)
+        offsets = np.arange(len(left)) - np.repeat(np.cumsum(counts) - counts, counts)
+        right = other_order[np.repeat(start, counts) + offsets]
+
+        coordinates = np.concatenate([self.coordinates[left], other.coordinates[right][:, extra]], axis=1)
+        values = self.values[left] * other.values[right]
+        nonzero = values != 0
+        return SparseFactor(self.variables + [other.variables[i] for i in extra], coordinates[nonzero],
+                            values[nonzero], self.log_scale + other.log_scale,
+                            self.shape + tuple(other.shape[i] for i in extra))
+
+    __mul__ = multiply
+
+    def _aggregate(self, variables: Union[str, List[str]], maximum: bool) -> 'SparseFactor':
+        """
+        Sums or maxes the given variables out of the stored entries.
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+        rest = [v for v in self.variables if v not in variables]
+        shape = [self.shape[self.variables.index(v)] for v in rest]
+
+        keys, inverse = np.unique(self._keys(rest), return_inverse=True)
+        if maximum:
+            values = np.zeros(len(keys))
+            np.maximum.at(values, inverse, self.values)
+        else:
+            values = np.bincount(inverse, self.values, minlength=len(keys))
+
+        # decode the keys back into the instantiations of the remaining variables
+        return SparseFactor(rest, self._decode(keys, shape), values, self.log_scale, shape)
+
+    def sum_out(self, variables: Union[str, List[str]]) -> 'SparseFactor':
+        """
+        Compute the factor in which the given variable(s) are summed-out.
+        """
+        return self._aggregate(variables, maximum=False)
+
+    def max_out(self, variables: Union[str, List[str]]) -> 'SparseFactor':
+        """
+        Compute the factor in which the given variable(s) are maxed-out.
+        """
+        return self._aggregate(variables, maximum=True)
+
+    def reduce(self, instantiation: pd.Series, drop: bool = True) -> 'SparseFactor':
+        """
+        Apply evidence to the factor by keeping only the compatible entries.
+
+        :param instantiation: a series of assignments as tuples. E.g.: pd.Series({"A": True, "B": False})
+        :param drop: if True the evidence variables are removed from the scope, otherwise they are kept.
+        :return: The reduced factor, or the factor itself if none of the evidence appears in it.
+        """
+        var_names = [v for v in instantiation.index if v in self.variables]
+        if not var_names:
+            return self
+
+        compatible = np.ones(len(self.values), dtype=bool)
+        for v in var_names:
+            compatible &= self.coordinates[:, self.variables.index(v)] == int(instantiation[v])
+
+        columns = [i for i, v in enumerate(self.variables) if not (drop and v in var_names)]
+        return SparseFactor([self.variables[i] for i in columns], self.coordinates[compatible][:, columns],
+                            self.values[compatible], self.log_scale, [self.shape[i] for i in columns])
+
+    def normalize(self) -> 'SparseFactor':
+        """
+        Returns the factor scaled so that its values sum to 1.
+        """
+        return SparseFactor(self.variables, self.coordinates, self.values / self.values.sum(), shape=self.shape)
+
+    def rescale(self) -> 'SparseFactor':
+        """
+        Returns the same factor with its largest value scaled to 1, the scaling moved into log_scale.
+        """
+        largest = self.values.max() if len(self.values) else 0.0
+        if largest <= 0:
+            return self
+        return SparseFactor(self.variables, self.coordinates, self.values / largest,
+                            self.log_scale + np.log(largest), self.shape)
+
+    @staticmethod
+    def select(factor: Union[Factor, 'SparseFactor'], threshold: float) -> Union[Factor, 'SparseFactor']:
+        """
+        Picks the representation of a factor by its density: sparse if at most a fraction 'threshold' of its
+        entries is nonzero, dense otherwise.
+
+        :param factor: Dense or sparse factor.
+        :param threshold: Largest density for which the sparse representation is used.
+        :return: The same factor in the chosen representation.
+        """
+        if isinstance(factor, SparseFactor):
+            return factor if factor.density <= threshold else factor.to_factor()
+        if np.count_nonzero(factor.values) <= threshold * factor.values.size:
+            return SparseFactor.from_factor(factor)
+        return factor
+
+    def __repr__(self) -> str:
+        return 'SparseFactor({}, {} entries)'.format(self.variables, len(self.values))
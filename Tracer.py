@@ -0,0 +1,133 @@
+from typing import List, Dict, Optional, Iterator
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+
+class Tracer:
+    """
+    Opt-in instrumentation of the queries of a BNReasoner. Per query it records the elimination order, the peak
+    size of the intermediate factors in cells and bytes, the count and total duration of every operation type
+    (ordering, evidence reduction, multiplication, summing out, ...) and the plan cache hits and misses. Every
+    operation is also kept as an event, which together form a structured trace.
+    """
+
+    def __init__(self) -> None:
+        self.queries = []
+        self.events = []
+        self._current = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def query(self, kind: str, query: List[str], evidence: List[str]) -> Iterator[Optional[Dict]]:
+        """
+        Records everything inside the with block as one query. Queries started inside another query (e.g. the
+        joint computed for a posterior) are part of the outer one.
+
+        :param kind: Type of query, e.g. 'posterior' or 'MAP'.
+        :param query: Query variables.
+        :param evidence: Names of the evidence variables.
+        """
+        if self._current is not None:
+            yield self._current
+            return
+
+        record = {'id': len(self.queries), 'kind': kind, 'query': list(query), 'evidence': list(evidence),
+                  'order': None, 'plan_cache': {'hits': 0, 'misses': 0}, 'peak_cells': 0, 'peak_bytes': 0,
+                  'operations': {}, 'seconds': 0.0}
+        self._current = record
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self._current = None
+            self.queries.append(record)
+
+    @contextmanager
+    def operation(self, name: str) -> Iterator[None]:
+        """
+        Times the with block as one operation of the given type within the current query.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_operation(name, start, time.perf_counter() - start)
+
+    def add_operation(self, name: str, start: float, duration: float) -> None:
+        """
+        Adds an operation that started at 'start' (time.perf_counter) and took 'duration' seconds.
+        """
+        record = self._current
+        if record is None:
+            return
+        with self._lock:
+            stats = record['operations'].setdefault(name, {'count': 0, 'seconds': 0.0})
+            stats['count'] += 1
+            stats['seconds'] += duration
+            self.events.append({'query': record['id'], 'operation': name, 'start': start, 'seconds': duration})
+
+    def factor(self, factor) -> None:
+        """
+        Updates the peak factor size of the current query with a dense or sparse intermediate factor.
+        """
+        record = self._current
+        if record is None:
+            return
+        size = factor.values.nbytes + (factor.coordinates.nbytes if hasattr(factor, 'coordinates') else 0)
+        with self._lock:
+            record['peak_cells'] = max(record['peak_cells'], factor.values.size)
+            record['peak_bytes'] = max(record['peak_bytes'], size)
+
+    def plan_cache(self, hit: bool) -> None:
+        """
+        Counts a plan cache lookup of the current query.
+        """
+        if self._current is not None:
+            self._current['plan_cache']['hits' if hit else 'misses'] += 1
+
+    def order(self, order: List[str]) -> None:
+        """
+        Records the elimination order of the current query.
+        """
+        if self._current is not None:
+            self._current['order'] = list(order)
+
+    # OUTPUT -----------------------------------------------------------------------------------------------------------
+
+    def trace(self) -> Dict[str, List[Dict]]:
+        """
+        Returns the structured trace: the record of every query and every operation event.
+        """
+        return {'queries': self.queries, 'events': self.events}
+
+    def write(self, file_path: str) -> None:
+        """
+        Writes the structured trace as JSON.
+        """
+        with open(file_path, 'w') as f:
+            json.dump(self.trace(), f, indent=2)
+
+    def summary(self, index: int = -1) -> str:
+        """
+        Returns a human-readable summary of one query, by default the last one.
+        """
+        record = self.queries[index]
+        lines = ['{} {} given {}: {:.6f} s'.format(record['kind'], record['query'], record['evidence'],
+                                                  record['seconds']),
+                 '  order: {}'.format(record['order']),
+                 '  peak factor: {} cells, {} bytes'.format(record['peak_cells'], record['peak_bytes']),
+                 '  plan cache: {} hits, {} misses'.format(record['plan_cache']['hits'],
+                                                           record['plan_cache']['misses'])]
+        for name, stats in sorted(record['operations'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append('  {:<12} {:>6} x {:>10.6f} s'.format(name, stats['count'], stats['seconds']))
+        return '\n'.join(lines)
+
+    def clear(self) -> None:
+        """
+        Drops all recorded queries and events.
+        """
+        self.queries = []
+        self.events = []
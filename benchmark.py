@@ -0,0 +1,201 @@
+####################################################################################################
+# benchmark.py
+# Description: Benchmark suite on random binary networks. Times loading, pruning, d-separation,
+# ordering, variable elimination, MAP and MPE across network sizes, writes the results as JSON
+# and compares them against a stored baseline to flag regressions.
+#
+# Usage:
+#   python benchmark.py run --sizes 20 50 100 --output results.json
+#   python benchmark.py compare baseline.json results.json --tolerance 0.25
+####################################################################################################
+
+from typing import List, Dict, Callable, Optional
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from BayesNet import BayesNet
+from BNReasoner import BNReasoner
+from Factor import Factor
+
+BENCHMARKS = ('load', 'prune', 'd-separation', 'ordering', 've', 'map', 'mpe')
+
+
+# --------------------------------- NETWORK GENERATOR --------------------------------- #
+
+def random_network(n_nodes: int, max_in_degree: int = 3, window: int = 5, seed: Optional[int] = None,
+                   max_states: int = 2) -> BayesNet:
+    """
+    Generates a random DAG with random CPTs. Every node draws up to max_in_degree parents among the 'window'
+    nodes before it, so the moral graph has bandwidth at most 'window' and the treewidth of the network is at most
+    'window'.
+
+    :param n_nodes: Number of variables, named X0, X1, ...
+    :param max_in_degree: Maximum number of parents of a variable.
+    :param window: Number of preceding variables a variable can take its parents from, bounds the treewidth.
+    :param seed: Seed of the random number generator.
+    :param max_states: Every variable gets between 2 and max_states states, 2 for a binary network.
+    :return: The generated network.
+    """
+    rng = np.random.default_rng(seed)
+    variables = ['X{}'.format(i) for i in range(n_nodes)]
+    cardinality = dict(zip(variables, rng.integers(2, max_states + 1, n_nodes))) if max_states > 2 else {}
+    edges = []
+    cpts = {}
+    for i, variable in enumerate(variables):
+        candidates = variables[max(0, i - window):i]
+        n_parents = rng.integers(0, min(max_in_degree, len(candidates)) + 1)
+        parents = [str(p) for p in rng.choice(candidates, size=n_parents, replace=False)] if n_parents else []
+
+        values = rng.random([cardinality.get(v, 2) for v in parents + [variable]])
+        cpts[variable] = Factor(parents + [variable], values / values.sum(axis=-1, keepdims=True))
+        edges += [(parent, variable) for parent in parents]
+
+    bn = BayesNet()
+    bn.create_bn(variables, edges, cpts)
+    return bn
+
+
+# --------------------------------- TIMING --------------------------------- #
+
+def best_time(function: Callable[[], object], repeat: int) -> float:
+    """
+    Returns the fastest of 'repeat' runs of the function in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_network(n_nodes: int, max_in_degree: int, window: int, seed: int, repeat: int,
+                      directory: str) -> List[Dict]:
+    """
+    Times every benchmark on one random network. Queries and evidence are drawn at random from the same seed,
+    so reruns time the same work.
+
+    :return: One result dictionary per benchmark.
+    """
+    rng = np.random.default_rng(seed)
+    bn = random_network(n_nodes, max_in_degree, window, seed)
+    path = os.path.join(directory, 'random_{}_{}_{}_{}.BIFXML'.format(n_nodes, max_in_degree, window, seed))
+    bn.write_bifxml(path)
+
+    variables = bn.get_all_variables()
+    picked = [str(v) for v in rng.choice(variables, size=min(5, n_nodes), replace=False)]
+    query = picked[:2]
+    evidence = pd.Series({v: bool(rng.integers(2)) for v in picked[2:]})
+    triples = [([str(x)], [str(y)], [str(z) for z in rng.choice(variables, size=min(3, n_nodes), replace=False)])
+               for x, y in rng.choice(variables, size=(100, 2))]
+
+    def load():
+        BayesNet().load_from_bifxml(path)
+
+    def fresh() -> BNReasoner:
+        # no plan cache, so every query is compiled and eliminated
+        return BNReasoner(net=bn, plan_cache_size=0)
+
+    timings = {
+        'load': best_time(load, repeat),
+        'prune': best_time(lambda: fresh().prune(query, evidence), repeat),
+        'd-separation': best_time(lambda: fresh().d_separation_batch(triples), repeat),
+        'ordering': best_time(lambda: fresh().find_order(variables), repeat),
+        've': best_time(lambda: fresh().marginal_distributions(query, evidence), repeat),
+        'map': best_time(lambda: fresh().MAP(query, evidence), repeat),
+        'mpe': best_time(lambda: fresh().MPE(evidence), repeat),
+    }
+
+    return [{'benchmark': name, 'nodes': n_nodes, 'max_in_degree': max_in_degree, 'window': window, 'seed': seed,
+             'seconds': timings[name]} for name in BENCHMARKS]
+
+
+def run(sizes: List[int], max_in_degree: int = 3, window: int = 5, seed: int = 0, repeat: int = 3) -> Dict:
+    """
+    Runs all benchmarks on one random network per size.
+
+    :return: The results with the environment they were measured in, ready to be written as JSON.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_nodes in sizes:
+            results += benchmark_network(n_nodes, max_in_degree, window, seed, repeat, directory)
+
+    return {'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                            'pandas': pd.__version__, 'machine': platform.machine(),
+                            'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+# --------------------------------- REGRESSION TRACKING --------------------------------- #
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.25) -> List[Dict]:
+    """
+    Compares two result sets benchmark by benchmark. A benchmark regressed when it takes more than
+    (1 + tolerance) times as long as in the baseline.
+
+    :return: One row per benchmark present in both result sets, with the ratio current / baseline.
+    """
+    def key(result: Dict) -> tuple:
+        return result['benchmark'], result['nodes'], result['max_in_degree'], result['window'], result['seed']
+
+    baseline_times = {key(r): r['seconds'] for r in baseline['results']}
+    rows = []
+    for result in current['results']:
+        if key(result) not in baseline_times:
+            continue
+        ratio = result['seconds'] / baseline_times[key(result)] if baseline_times[key(result)] > 0 else np.inf
+        rows.append({'benchmark': result['benchmark'], 'nodes': result['nodes'],
+                     'baseline': baseline_times[key(result)], 'current': result['seconds'],
+                     'ratio': ratio, 'regression': ratio > 1 + tolerance})
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark suite on random binary networks.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks and write the results as JSON')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[20, 50, 100])
+    run_parser.add_argument('--max-in-degree', type=int, default=3)
+    run_parser.add_argument('--window', type=int, default=5)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--output', default='benchmark_results.json')
+
+    compare_parser = commands.add_parser('compare', help='flag regressions against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=0.25)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run(args.sizes, args.max_in_degree, args.window, args.seed, args.repeat)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        for r in results['results']:
+            print('{:<14} {:>6} nodes {:>10.6f} s'.format(r['benchmark'], r['nodes'], r['seconds']))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.tolerance)
+    for r in rows:
+        flag = '  REGRESSION' if r['regression'] else ''
+        print('{:<14} {:>6} nodes {:>10.6f} s -> {:>10.6f} s  x{:.2f}{}'.format(
+            r['benchmark'], r['nodes'], r['baseline'], r['current'], r['ratio'], flag))
+
+    # a non-zero exit code lets CI fail on regressions
+    return 1 if any(r['regression'] for r in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,9 @@
 import networkx as nx
-from typing import Union, List
+import heapq
+import math
+import random
+import time
+from typing import List, Dict, Set, Tuple
 
 # --------------------------------- ORDERING HEURISTICS --------------------------------- #	
 
@@ -49,3 +53,181 @@ def min_fill(interaction_graph: nx.DiGraph, variables = List[str])-> str:
     # find node with minimum penalty points
     elimination_order = min(dict_points, key=dict_points.get)
     return elimination_order
+
+
+# --------------------------------- ORDERING ENGINE --------------------------------- #
+
+HEURISTICS = ('min', 'fill', 'weighted-fill', 'weight')
+
+def elimination_score(adjacency: Dict[str, Set[str]], node: str, heuristic: str,
+                      cardinalities: Dict[str, int]) -> int:
+    """
+    Score of eliminating a node from the graph given as adjacency sets, lower is better.
+        'min': number of neighbours (min-degree)
+        'fill': number of fill-in edges between neighbours (min-fill)
+        'weighted-fill': sum over the fill-in edges of the product of the cardinalities of their endpoints
+        'weight': size of the factor created by eliminating the node (min-weight)
+    """
+    neighbours = adjacency[node]
+
+    if heuristic == 'min':
+        return len(neighbours)
+
+    if heuristic == 'weight':
+        return math.prod(cardinalities.get(n, 2) for n in neighbours) * cardinalities.get(node, 2)
+
+    score = 0
+    neighbours = list(neighbours)
+    for i in range(len(neighbours)):
+        for j in range(i + 1, len(neighbours)):
+            if neighbours[j] not in adjacency[neighbours[i]]:
+                if heuristic == 'fill':
+                    score += 1
+                else:
+                    score += cardinalities.get(neighbours[i], 2) * cardinalities.get(neighbours[j], 2)
+    return score
+
+def greedy_order(interaction_graph: nx.Graph, variables: List[str], heuristic: str = 'min',
+                 cardinalities: Dict[str, int] = None, rng: random.Random = None) -> Tuple[List[str], int, int]:
+    """
+    Greedy elimination ordering of the variables with the scores kept in a heap. After eliminating a node only the
+    scores that can change are recomputed: its neighbours, and for fill heuristics also the common neighbours of
+    the fill-in edges. Ties are broken by the position in 'variables', or at random if rng is given.
+    return: the elimination order, the induced width and the size (number of cells) of the largest factor created
+    """
+    if heuristic not in HEURISTICS:
+        raise ValueError('Unknown heuristic {}.'.format(heuristic))
+    cardinalities = cardinalities or {}
+
+    adjacency = {node: set(interaction_graph.neighbors(node)) for node in interaction_graph.nodes}
+    position = {node: i for i, node in enumerate(variables)}
+    if rng is not None:
+        shuffled = rng.sample(range(len(variables)), len(variables))
+        position = {node: shuffled[i] for i, node in enumerate(variables)}
+    scores = {node: elimination_score(adjacency, node, heuristic, cardinalities) for node in variables}
+    heap = [(score, position[node], node) for node, score in scores.items()]
+    heapq.heapify(heap)
+
+    order = []
+    induced_width = 0
+    max_factor_size = 1
+    while heap:
+        score, _, node = heapq.heappop(heap)
+
+        # skip entries that were eliminated or whose score has been updated since
+        if node not in scores or scores[node] != score:
+            continue
+        del scores[node]
+        order.append(node)
+
+        neighbours = adjacency.pop(node)
+        induced_width = max(induced_width, len(neighbours))
+        max_factor_size = max(max_factor_size,
+                              math.prod(cardinalities.get(n, 2) for n in neighbours) * cardinalities.get(node, 2))
+
+        # connect the neighbours and remove the node
+        affected = set(neighbours)
+        for neighbour in neighbours:
+            adjacency[neighbour].discard(node)
+        for a in neighbours:
+            for b in neighbours:
+                if a < b and b not in adjacency[a]:
+                    adjacency[a].add(b)
+                    adjacency[b].add(a)
+                    if heuristic in ('fill', 'weighted-fill'):
+                        affected |= adjacency[a] & adjacency[b]
+
+        # update the scores that can have changed
+        for n in affected:
+            if n in scores:
+                new_score = elimination_score(adjacency, n, heuristic, cardinalities)
+                if new_score != scores[n]:
+                    scores[n] = new_score
+                    heapq.heappush(heap, (new_score, position[n], n))
+
+    return order, induced_width, max_factor_size
+
+
+def order_cost(interaction_graph: nx.Graph, order: List[str],
+               cardinalities: Dict[str, int] = None) -> Tuple[int, int, int]:
+    """
+    Simulates eliminating the variables in the given order.
+    return: the total size (number of cells) of all factors created, the induced width and the size of the
+        largest factor created
+    """
+    cardinalities = cardinalities or {}
+    adjacency = {node: set(interaction_graph.neighbors(node)) for node in interaction_graph.nodes}
+
+    total_size = 0
+    induced_width = 0
+    max_factor_size = 1
+    for node in order:
+        neighbours = adjacency.pop(node)
+        size = math.prod(cardinalities.get(n, 2) for n in neighbours) * cardinalities.get(node, 2)
+        total_size += size
+        induced_width = max(induced_width, len(neighbours))
+        max_factor_size = max(max_factor_size, size)
+
+        for neighbour in neighbours:
+            adjacency[neighbour].discard(node)
+            adjacency[neighbour] |= neighbours - {neighbour}
+
+    return total_size, induced_width, max_factor_size
+
+def search_order(interaction_graph: nx.Graph, variables: List[str], time_budget: float,
+                 cardinalities: Dict[str, int] = None, annealing: bool = True,
+                 initial: List[str] = None, seed: int = None) -> Tuple[List[str], int]:
+    """
+    Anytime search for an elimination order of the variables with the smallest total factor size.
+    Starts from the greedy order of every heuristic (and 'initial', if given), then spends the time budget on
+    greedy restarts with random tie-breaking and, if 'annealing' is set, the second half of the budget on
+    simulated annealing over swaps of neighbouring positions in the best order. The search stops early when there
+    is nothing to improve: at most one variable, or an order that reaches the lower bound on the total size.
+    return: the best order found and its total factor size
+    """
+    if len(variables) <= 1:
+        return list(variables), order_cost(interaction_graph, variables, cardinalities)[0]
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    deadline = start + time_budget
+
+    # every variable is at least eliminated together with its neighbours that are never eliminated
+    cardinalities = cardinalities or {}
+    eliminated = set(variables)
+    lower_bound = sum(math.prod(cardinalities.get(n, 2) for n in interaction_graph.neighbors(v) if n not in eliminated)
+                      * cardinalities.get(v, 2) for v in variables)
+
+    best, best_cost = None, None
+    candidates = [initial] if initial is not None else []
+    candidates += [greedy_order(interaction_graph, variables, h, cardinalities)[0] for h in HEURISTICS]
+    for order in candidates:
+        cost = order_cost(interaction_graph, order, cardinalities)[0]
+        if best_cost is None or cost < best_cost:
+            best, best_cost = list(order), cost
+    if best_cost <= lower_bound:
+        return best, best_cost
+
+    # randomized restarts
+    restarts_deadline = start + time_budget / 2 if annealing else deadline
+    while best_cost > lower_bound and time.perf_counter() < restarts_deadline:
+        order = greedy_order(interaction_graph, variables, rng.choice(HEURISTICS), cardinalities, rng)[0]
+        cost = order_cost(interaction_graph, order, cardinalities)[0]
+        if cost < best_cost:
+            best, best_cost = order, cost
+
+    # simulated annealing on the log of the total size, cooling down linearly until the deadline
+    current, current_cost = list(best), best_cost
+    while annealing and best_cost > lower_bound and time.perf_counter() < deadline:
+        temperature = max((deadline - time.perf_counter()) / max(time_budget / 2, 1e-9), 1e-3)
+        i = rng.randrange(len(current) - 1)
+        neighbour = current[:i] + [current[i + 1], current[i]] + current[i + 2:]
+        cost = order_cost(interaction_graph, neighbour, cardinalities)[0]
+
+        delta = math.log(cost) - math.log(current_cost)
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            current, current_cost = neighbour, cost
+            if cost < best_cost:
+                best, best_cost = neighbour, cost
+
+    return best, best_cost
@@ -1,8 +1,904 @@
 import unittest
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from BayesNet import BayesNet
+from BNReasoner import BNReasoner
+from Factor import Factor
+from SparseFactor import SparseFactor
+from heuristics import greedy_order, search_order, order_cost
+from QueryPlan import PlanCache, MemoryBudgetError
+from InferenceSession import InferenceSession
+from Sampler import Sampler
+from ParallelExecutor import ParallelExecutor
+from RecursiveConditioning import RecursiveConditioning
+from ArithmeticCircuit import ArithmeticCircuit
+from example_lecture import create_lecture_example
+from benchmark import random_network, compare
 
 
 class TestBN(unittest.TestCase):
-    pass
+
+    def test_load_from_bifxml(self):
+        bn = BayesNet()
+        bn.load_from_bifxml('testing/dog_problem.BIFXML')
+        self.assertEqual(bn.get_all_variables(), ['light-on', 'bowel-problem', 'dog-out', 'hear-bark', 'family-out'])
+        self.assertEqual(list(bn.get_cpt('dog-out').columns), ['family-out', 'bowel-problem', 'dog-out', 'p'])
+        np.testing.assert_allclose(bn.get_cpt('dog-out')['p'], [0.99, 0.01, 0.97, 0.03, 0.9, 0.1, 0.3, 0.7])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            bn = BayesNet()
+            bn.load_from_bifxml('testing/relations.BIFXML', cache_dir=cache_dir)
+            cached = BayesNet()
+            cached.load_from_bifxml('testing/relations.BIFXML', cache_dir=cache_dir)
+            self.assertEqual(cached.get_all_variables(), bn.get_all_variables())
+            self.assertEqual(set(cached.structure.edges), set(bn.structure.edges))
+            for variable in bn.get_all_variables():
+                pd.testing.assert_frame_equal(cached.get_cpt(variable), bn.get_cpt(variable))
+
+    def test_write_bifxml(self):
+        bn = BayesNet()
+        bn.load_from_bifxml('testing/dog_problem.BIFXML')
+        with tempfile.TemporaryDirectory() as directory:
+            bn.write_bifxml(directory + '/dog_problem.BIFXML')
+            written = BayesNet()
+            written.load_from_bifxml(directory + '/dog_problem.BIFXML')
+        self.assertEqual(written.get_all_variables(), bn.get_all_variables())
+        self.assertEqual(set(written.structure.edges), set(bn.structure.edges))
+        for variable in bn.get_all_variables():
+            pd.testing.assert_frame_equal(written.get_cpt(variable), bn.get_cpt(variable))
+
+    def test_create_bn_rejects_cycles(self):
+        cpts = {v: Factor([v], np.array([0.5, 0.5])) for v in ['A', 'B']}
+        with self.assertRaises(Exception):
+            BayesNet().create_bn(['A', 'B'], [('A', 'B'), ('B', 'A')], cpts)
+
+
+class TestMultiValued(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.br = BNReasoner(net='testing/weather.BIFXML')
+        self.bn = random_network(9, window=4, seed=4, max_states=4)
+
+    def brute_force(self, query, evidence):
+        joint = Factor.product([self.bn.get_factor(v) for v in self.bn.get_all_variables()]).reduce(evidence)
+        return Factor(query, joint.sum_out([v for v in joint.variables if v not in query]).expand(query))
+
+    def test_load_from_bifxml(self):
+        bn = self.br.bn
+        self.assertEqual(bn.get_states('traffic'), ['low', 'medium', 'high'])
+        self.assertEqual([bn.get_cardinality(v) for v in bn.get_all_variables()], [3, 2, 3, 2])
+        self.assertEqual(bn.get_factor('wet-grass').values.shape, (3, 2, 2))
+        self.assertEqual(bn.get_cpt('weather')['weather'].tolist(), [0, 1, 2])
+
+        # Pr(weather | wet-grass) by hand, summing out the sprinkler
+        posterior = self.br.marginal_distributions(['weather'], pd.Series({'wet-grass': True}))
+        np.testing.assert_allclose(posterior['p'], np.array([0.28, 0.102, 0.1801]) / 0.5621)
+
+    def test_write_bifxml(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.br.bn.write_bifxml(directory + '/weather.BIFXML')
+            written = BayesNet()
+            written.load_from_bifxml(directory + '/weather.BIFXML', cache_dir=directory)
+            cached = BayesNet()
+            cached.load_from_bifxml(directory + '/weather.BIFXML', cache_dir=directory)
+        for variable in self.br.bn.get_all_variables():
+            self.assertEqual(cached.get_states(variable), self.br.bn.get_states(variable))
+            pd.testing.assert_frame_equal(cached.get_cpt(variable), self.br.bn.get_cpt(variable))
+
+    def test_encode_instantiation(self):
+        evidence = self.br.bn.encode_instantiation(pd.Series({'traffic': 'high', 'sprinkler': True}))
+        self.assertEqual(evidence.to_dict(), {'traffic': 2, 'sprinkler': True})
+        with self.assertRaises(ValueError):
+            self.br.bn.encode_instantiation(pd.Series({'traffic': 'jammed'}))
+        with self.assertRaises(ValueError):
+            self.br.bn.encode_instantiation(pd.Series({'traffic': 1.7}))
+        with self.assertRaises(ValueError):
+            self.br.bn.encode_instantiations(pd.DataFrame({'traffic': [0.0, 1.7]}))
+
+    def test_binary_state_names(self):
+        # the bundled networks list True before False, index 0 still stands for False
+        br = BNReasoner(net='testing/lecture_example.BIFXML')
+        self.assertEqual(br.bn.get_states('Rain?'), ['False', 'True'])
+        for name, value in [('True', True), ('False', False)]:
+            pd.testing.assert_frame_equal(br.marginal_distributions(['Wet Grass?'], pd.Series({'Rain?': name})),
+                                          br.marginal_distributions(['Wet Grass?'], pd.Series({'Rain?': value})))
+
+    def test_evidence_by_name(self):
+        by_name = self.br.marginal_distributions(['traffic'], pd.Series({'weather': 'rainy', 'wet-grass': 'true'}))
+        by_index = self.br.marginal_distributions(['traffic'], pd.Series({'weather': 2, 'wet-grass': True}))
+        pd.testing.assert_frame_equal(by_name, by_index)
+        self.assertEqual(self.br.MAP(['traffic'], pd.Series({'weather': 'rainy'})).loc[0, 'traffic'], 2)
+
+        batch = self.br.batch_marginal_distributions(['traffic'], pd.DataFrame({'weather': ['sunny', 'rainy']}))
+        np.testing.assert_allclose(batch[1], by_index['p'])
+
+        session = InferenceSession(self.br)
+        session.add_evidence('weather', 'rainy')
+        np.testing.assert_allclose(session.marginal_distributions(['traffic'])['p'], [0.1, 0.3, 0.6])
+
+        for evidence in [pd.Series({'weather': 7}), pd.Series({'weather': 'foggy'}), pd.Series({'season': 1})]:
+            with self.assertRaises(ValueError):
+                self.br.marginal_distributions(['traffic'], evidence)
+        with self.assertRaisesRegex(ValueError, 'sunny'):
+            self.br.batch_probability_of_evidence(pd.DataFrame({'weather': [0, 3]}))
+
+    def test_engines_match_brute_force(self):
+        evidence = pd.Series({'X1': 3, 'X5': 1}, dtype=object)
+        expected = self.brute_force(['X8', 'X2'], evidence)
+        for options in [{}, {'engine': 'jt'}, {'engine': 'rc', 'rc_cache_size': 0}, {'sparse_threshold': 0.9},
+                        {'scaled': True}, {'memory_budget': 16 * 8, 'on_budget': 'condition'}]:
+            br = BNReasoner(net=self.bn, **options)
+            np.testing.assert_allclose(br.posterior_factor(['X8', 'X2'], evidence).expand(['X8', 'X2']),
+                                       expected.values / expected.values.sum())
+        br = BNReasoner(net=self.bn)
+        self.assertAlmostEqual(br.probability_of_evidence(evidence), expected.values.sum())
+
+        circuit = br.compile_circuit()
+        self.assertAlmostEqual(circuit.probability_of_evidence(evidence), expected.values.sum())
+        np.testing.assert_allclose(circuit.marginals(evidence)['X8'].values,
+                                   expected.values.sum(axis=1) / expected.values.sum())
+
+    def test_map_mpe(self):
+        evidence = pd.Series({'X3': 2}, dtype=object)
+        expected = self.brute_force(['X1', 'X6'], evidence)
+        result = BNReasoner(net=self.bn).MAP(['X1', 'X6'], evidence)
+        self.assertEqual(tuple(result.loc[0, ['X1', 'X6']]), np.unravel_index(expected.values.argmax(), (4, 4)))
+        self.assertAlmostEqual(result.loc[0, 'p'], expected.values.max() / expected.values.sum())
+
+        variables = [v for v in self.bn.get_all_variables() if v != 'X3']
+        joint = self.brute_force(variables, evidence)
+        result = BNReasoner(net=self.bn).MPE(evidence)
+        self.assertEqual(tuple(result.loc[0, variables]), np.unravel_index(joint.values.argmax(), joint.values.shape))
+
+    def test_sparse_factor(self):
+        factor = self.bn.get_factor('X4').multiply(self.bn.get_factor('X2'))
+        factor.values[factor.values < 0.3] = 0
+        sparse = SparseFactor.from_factor(factor)
+        np.testing.assert_allclose(sparse.sum_out('X2').to_factor().values, factor.sum_out('X2').values)
+        np.testing.assert_allclose(sparse.to_factor().values, factor.values)
+
+    def test_many_states(self):
+        values = np.zeros((2, 200))
+        values[1, 150] = 1.0
+        factor = Factor(['A', 'B'], values)
+        self.assertEqual(SparseFactor.from_factor(factor).to_factor().values[1, 150], 1.0)
+        self.assertEqual(SparseFactor.from_factor(factor).reduce(pd.Series({'B': 150})).values.tolist(), [1.0])
+
+        table = factor.to_dataframe()
+        self.assertEqual(table.loc[table['p'] > 0, 'B'].tolist(), [150])
+        np.testing.assert_array_equal(Factor.from_dataframe(table).values, values)
+
+
+class TestFactor(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bn = BayesNet()
+        self.bn.load_from_bifxml('testing/lecture_example.BIFXML')
+
+    def test_dataframe_round_trip(self):
+        for variable, cpt in self.bn.get_all_cpts().items():
+            table = Factor.from_dataframe(cpt).to_dataframe()
+            pd.testing.assert_frame_equal(table, cpt, check_dtype=False)
+
+    def test_multiply_matches_dataframe(self):
+        cpt1 = self.bn.get_cpt('Sprinkler?')
+        cpt2 = self.bn.get_cpt('Wet Grass?')
+        expected = BNReasoner.factor_multiplication(cpt1, cpt2)
+        product = Factor.from_dataframe(cpt1).multiply(Factor.from_dataframe(cpt2))
+
+        columns = [c for c in expected.columns if c != 'p']
+        expected = expected.sort_values(columns).reset_index(drop=True)
+        result = Factor(columns, product.expand(columns)).to_dataframe()
+        np.testing.assert_allclose(result['p'], expected['p'])
+
+    def test_sum_out_and_max_out(self):
+        factor = self.bn.get_factor('Wet Grass?')
+        np.testing.assert_allclose(factor.sum_out('Wet Grass?').values, np.ones((2, 2)))
+        self.assertEqual(factor.max_out(['Rain?', 'Wet Grass?']).variables, ['Sprinkler?'])
+        np.testing.assert_allclose(factor.max_out(['Rain?', 'Wet Grass?']).values, [1.0, 0.95])
+
+    def test_reduce(self):
+        factor = self.bn.get_factor('Wet Grass?')
+        evidence = pd.Series({'Rain?': True, 'Winter?': False})
+        self.assertEqual(factor.reduce(evidence).variables, ['Sprinkler?', 'Wet Grass?'])
+        kept = factor.reduce(evidence, drop=False)
+        self.assertEqual(kept.variables, factor.variables)
+        self.assertEqual(kept.values[:, 0, :].sum(), 0)
+        self.assertIs(factor.reduce(pd.Series({'Winter?': True})), factor)
+
+    def test_variable_elimination(self):
+        br = BNReasoner(net='testing/lecture_example2.BIFXML')
+        prior = br.variable_elimination(['C'], pd.Series(dtype='float64'))
+        np.testing.assert_allclose(prior['p'], [0.624, 0.376])
+        posterior = br.marginal_distributions(['C'], pd.Series({'A': True}))
+        np.testing.assert_allclose(posterior['p'], [0.68, 0.32])
+
+
+class TestSparseFactor(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.f = Factor(['A', 'B'], np.array([[0.0, 0.3], [0.7, 0.0]]))
+        self.g = Factor(['B', 'C'], np.array([[0.5, 0.5], [0.0, 1.0]]))
+
+    def test_conversion(self):
+        sparse = SparseFactor.from_factor(self.f)
+        self.assertEqual(len(sparse.values), 2)
+        self.assertEqual(sparse.density, 0.5)
+        np.testing.assert_array_equal(sparse.to_factor().values, self.f.values)
+
+    def test_operations_match_dense(self):
+        sparse = SparseFactor.from_factor(self.f)
+        product = self.f * self.g
+        for result in [sparse * self.g, self.g * sparse]:
+            np.testing.assert_allclose(result.to_factor().expand(product.variables), product.values)
+        np.testing.assert_allclose(sparse.multiply(self.g).sum_out('B').to_factor().values,
+                                   product.sum_out('B').values)
+        np.testing.assert_allclose(sparse.max_out('A').to_factor().values, self.f.max_out('A').values)
+        np.testing.assert_allclose(sparse.reduce(pd.Series({'A': True})).to_factor().values, [0.7, 0.0])
+
+    def test_select(self):
+        self.assertIsInstance(SparseFactor.select(self.f, 0.5), SparseFactor)
+        self.assertIsInstance(SparseFactor.select(self.f, 0.25), Factor)
+
+    def test_sparse_elimination(self):
+        evidence = pd.Series({'Rain?': True, 'Wet Grass?': False})
+        dense = BNReasoner(net='testing/lecture_example.BIFXML')
+        sparse = BNReasoner(net='testing/lecture_example.BIFXML', sparse_threshold=1.0)
+        for query in [['Slippery Road?'], ['Winter?', 'Rain?']]:
+            pd.testing.assert_frame_equal(sparse.variable_elimination(query, evidence),
+                                          dense.variable_elimination(query, evidence))
+
+
+class TestScaledArithmetic(unittest.TestCase):
+
+    @staticmethod
+    def chain(n: int) -> BayesNet:
+        """
+        Hidden chain h0 -> h1 -> ... with an unlikely observation o_i of every h_i.
+        """
+        variables, edges, cpts = [], [], {}
+        for i in range(n):
+            parents = ['h{}'.format(i - 1)] if i else []
+            cpts['h{}'.format(i)] = Factor(parents + ['h{}'.format(i)],
+                                           np.array([[0.9, 0.1], [0.2, 0.8]]) if i else np.array([0.5, 0.5]))
+            cpts['o{}'.format(i)] = Factor(['h{}'.format(i), 'o{}'.format(i)], np.array([[0.999, 0.001],
+                                                                                         [0.99, 0.01]]))
+            variables += ['h{}'.format(i), 'o{}'.format(i)]
+            edges += [(p, 'h{}'.format(i)) for p in parents] + [('h{}'.format(i), 'o{}'.format(i))]
+        bn = BayesNet()
+        bn.create_bn(variables, edges, cpts)
+        return bn
+
+    def test_matches_linear(self):
+        bn = self.chain(10)
+        evidence = pd.Series({'o{}'.format(i): True for i in range(10)})
+        linear, scaled = BNReasoner(net=bn), BNReasoner(net=bn, scaled=True)
+        np.testing.assert_allclose(scaled.variable_elimination(['h5'], evidence)['p'],
+                                   linear.variable_elimination(['h5'], evidence)['p'])
+        np.testing.assert_allclose(scaled.posterior_factor(['h5'], evidence).values,
+                                   linear.joint_factor(['h5'], evidence).normalize().values)
+        self.assertAlmostEqual(scaled.log_probability_of_evidence(evidence),
+                               linear.log_probability_of_evidence(evidence))
+        pd.testing.assert_frame_equal(scaled.MAP(['h4', 'h5'], evidence, k=3), linear.MAP(['h4', 'h5'], evidence, k=3))
+
+    def test_no_underflow(self):
+        bn = self.chain(400)
+        evidence = pd.Series({'o{}'.format(i): True for i in range(400)})
+        br = BNReasoner(net=bn, scaled=True)
+        self.assertEqual(BNReasoner(net=bn).log_probability_of_evidence(evidence), -np.inf)
+        self.assertTrue(np.isfinite(br.log_probability_of_evidence(evidence)))
+
+        posterior = br.posterior_factor(['h200'], evidence).values
+        self.assertAlmostEqual(posterior.sum(), 1)
+        self.assertGreater(posterior[1], posterior[0])
+        self.assertEqual(len(br.MAP(['h200'], evidence)), 1)
+
+
+class TestEvidenceReduction(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bn = BayesNet()
+        self.bn.load_from_bifxml('testing/lecture_example.BIFXML')
+        self.evidence = pd.Series({'Rain?': True, 'Sprinkler?': False})
+
+    def test_compatible_instantiations(self):
+        table = self.bn.get_compatible_instantiations_table(self.evidence, self.bn.get_cpt('Wet Grass?'))
+        self.assertEqual(len(table), 2)
+        self.assertTrue(table['Rain?'].all())
+        self.assertFalse(table['Sprinkler?'].any())
+
+    def test_reduce_factor(self):
+        cpt = self.bn.get_cpt('Wet Grass?')
+        reduced = self.bn.reduce_factor(self.evidence, cpt)
+        np.testing.assert_allclose(reduced['p'], [0, 0, 0.2, 0.8, 0, 0, 0, 0])
+        np.testing.assert_allclose(cpt['p'], [1.0, 0.0, 0.2, 0.8, 0.1, 0.9, 0.05, 0.95])
+        self.assertIs(self.bn.reduce_factor(self.evidence, self.bn.get_cpt('Winter?')), self.bn.get_cpt('Winter?'))
+
+    def test_reduce_factor_drop(self):
+        reduced = self.bn.reduce_factor(self.evidence, self.bn.get_cpt('Wet Grass?'), drop=True)
+        self.assertEqual(list(reduced.columns), ['Wet Grass?', 'p'])
+        np.testing.assert_allclose(reduced['p'], [0.2, 0.8])
+
+    def test_reduce_all_factors(self):
+        reduced = self.bn.reduce_all_factors(self.evidence, drop=True)
+        self.assertEqual(set(reduced), set(self.bn.get_all_variables()))
+        self.assertEqual(list(reduced['Slippery Road?'].columns), ['Slippery Road?', 'p'])
+        self.assertIs(reduced['Winter?'], self.bn.get_cpt('Winter?'))
+
+
+class TestQueryPlan(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.br = BNReasoner(net='testing/dog_problem.BIFXML')
+
+    def test_plan_is_reused(self):
+        first = self.br.variable_elimination(['hear-bark'], pd.Series({'family-out': True}))
+        second = self.br.variable_elimination(['hear-bark'], pd.Series({'family-out': False}))
+        self.assertEqual((self.br.plan_cache.hits, self.br.plan_cache.misses), (1, 1))
+        np.testing.assert_allclose(first['p'], [0.187969, 0.662031], atol=1e-6)
+        self.assertFalse(np.allclose(first['p'], second['p']))
+
+        # the cached plan gives the same result as a fresh one
+        fresh = BNReasoner(net='testing/dog_problem.BIFXML', plan_cache_size=0)
+        expected = fresh.variable_elimination(['hear-bark'], pd.Series({'family-out': False}))
+        np.testing.assert_allclose(second['p'], expected['p'])
+        self.assertEqual(len(fresh.plan_cache), 0)
+
+    def test_plan_rejects_other_evidence(self):
+        plan = self.br.compile_plan(['hear-bark'], ['family-out'])
+        with self.assertRaises(ValueError):
+            plan.execute(self.br.bn, pd.Series({'light-on': True}))
+
+    def test_relevance(self):
+        # light-on is barren, the ancestors of the query and the evidence stay in
+        plan = self.br.compile_plan(['hear-bark'], ['family-out'])
+        self.assertEqual(sorted(plan.variables), ['bowel-problem', 'dog-out', 'family-out', 'hear-bark'])
+        self.assertEqual(plan.avoided, {'factors': 1, 'variables': 1})
+
+        # given dog-out, hear-bark is d-separated from its ancestors, which only matter for Pr(Q ^ e)
+        joint = self.br.compile_plan(['hear-bark'], ['dog-out'])
+        posterior = self.br.compile_plan(['hear-bark'], ['dog-out'], normalized=True)
+        self.assertEqual(len(joint.variables), 4)
+        self.assertEqual(posterior.variables, ['hear-bark'])
+        self.assertEqual(posterior.avoided, {'factors': 4, 'variables': 3})
+        evidence = pd.DataFrame({'dog-out': [True, False]})
+        np.testing.assert_allclose(self.br.batch_marginal_distributions(['hear-bark'], evidence),
+                                   [[0.01, 0.99], [0.7, 0.3]])
+
+    def test_threaded_execution(self):
+        threaded = BNReasoner(net='testing/dog_problem.BIFXML', threads=4)
+        evidence = pd.DataFrame({'family-out': [True, False, True], 'light-on': [True, True, False]})
+        for query in [['hear-bark'], ['dog-out', 'bowel-problem']]:
+            expected = self.br.variable_elimination(query, evidence.iloc[0])
+            pd.testing.assert_frame_equal(threaded.variable_elimination(query, evidence.iloc[0]), expected)
+            np.testing.assert_allclose(threaded.batch_marginal_distributions(query, evidence),
+                                       self.br.batch_marginal_distributions(query, evidence))
+
+    def test_lru_eviction(self):
+        cache = PlanCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+
+class TestBatchInference(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.br = BNReasoner(net='testing/dog_problem.BIFXML')
+        self.evidence = pd.DataFrame({'light-on': [True, False, True, False],
+                                      'hear-bark': [True, True, False, False]})
+
+    def test_matches_per_row_inference(self):
+        posteriors = self.br.batch_marginal_distributions(['family-out', 'dog-out'], self.evidence)
+        self.assertEqual(posteriors.shape, (4, 4))
+        for i, row in self.evidence.iterrows():
+            expected = self.br.posterior_factor(['family-out', 'dog-out'], row).normalize()
+            np.testing.assert_allclose(posteriors[i], expected.values.flatten())
+
+    def test_evidence_on_query(self):
+        posteriors = self.br.batch_marginal_distributions(['light-on'], self.evidence)
+        np.testing.assert_allclose(posteriors, [[0, 1], [1, 0], [0, 1], [1, 0]])
+
+    def test_probability_of_evidence(self):
+        probabilities = self.br.batch_probability_of_evidence(self.evidence)
+        self.assertEqual(probabilities.shape, (4,))
+        self.assertAlmostEqual(probabilities.sum(), 1)
+        for i, row in self.evidence.iterrows():
+            self.assertAlmostEqual(probabilities[i], self.br.probability_of_evidence(row))
+
+
+class TestProbabilityOfEvidence(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.br = BNReasoner(net='testing/dog_problem.BIFXML')
+        self.evidence = pd.Series({'hear-bark': True, 'light-on': False})
+
+        # brute force from the joint over all variables
+        variables = self.br.bn.get_all_variables()
+        self.joint = self.br.joint_factor(variables, pd.Series(dtype=object))
+
+    def test_probability_of_evidence(self):
+        expected = float(self.joint.reduce(self.evidence).values.sum())
+        self.assertAlmostEqual(self.br.probability_of_evidence(self.evidence), expected)
+        self.assertAlmostEqual(self.br.probability_of_evidence(pd.Series(dtype=object)), 1)
+
+    def test_posterior_with_evidence_parents(self):
+        # both evidence variables have parents, so their CPT entries are not Pr(e)
+        reduced = self.joint.reduce(self.evidence)
+        expected = reduced.sum_out([v for v in reduced.variables if v != 'family-out']).normalize()
+        posterior, evidence_prob = self.br.posterior_with_evidence(['family-out'], self.evidence)
+        np.testing.assert_allclose(posterior.values, expected.values)
+        np.testing.assert_allclose(self.br.marginal_distributions(['family-out'], self.evidence)['p'], expected.values)
+        self.assertAlmostEqual(evidence_prob, self.br.probability_of_evidence(self.evidence))
+
+
+class TestJunctionTree(unittest.TestCase):
+
+    def test_all_marginals_match_variable_elimination(self):
+        br = BNReasoner(net='testing/relations.BIFXML', engine='jt')
+        evidence = pd.Series({'dating': True, 'religion': False})
+        marginals = br.all_marginals(evidence)
+        for variable in br.bn.get_all_variables():
+            expected = br.joint_factor([variable], evidence).normalize()
+            np.testing.assert_allclose(marginals[variable]['p'], expected.values)
+        self.assertAlmostEqual(br.junction_tree().probability_of_evidence(), 0.2303286)
+
+    def test_in_clique_joint(self):
+        br = BNReasoner(net='testing/dog_problem.BIFXML', engine='jt')
+        evidence = pd.Series({'hear-bark': True})
+        posterior = br.marginal_distributions(['family-out', 'dog-out'], evidence)
+        expected = br.joint_factor(['family-out', 'dog-out'], evidence).normalize()
+        np.testing.assert_allclose(posterior['p'], expected.values.flatten())
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            BNReasoner(net='testing/dog_problem.BIFXML', engine='foo')
+
+
+class TestRecursiveConditioning(unittest.TestCase):
+
+    def test_marginals_match_variable_elimination(self):
+        for net in ['testing/relations.BIFXML', random_network(14, window=4, seed=2)]:
+            exact = BNReasoner(net=net)
+            variables = exact.bn.get_all_variables()
+            evidence = pd.Series({variables[1]: True, variables[-2]: False})
+            for cache_size in [None, 10, 0]:
+                br = BNReasoner(net=net, engine='rc', rc_cache_size=cache_size)
+                for query in [[variables[0]], [variables[-1], variables[2]]]:
+                    pd.testing.assert_frame_equal(br.marginal_distributions(query, evidence),
+                                                  exact.marginal_distributions(query, evidence))
+
+    def test_cache_size(self):
+        bn = random_network(30, window=4, seed=5)
+        order = BNReasoner(net=bn).find_order(bn.get_all_variables())
+        evidence = pd.Series({'X3': True})
+        calls = []
+        for cache_size in [0, 20, None]:
+            rc = RecursiveConditioning(bn, order, cache_size)
+            rc.joint(['X25'], evidence)
+            if cache_size is not None:
+                self.assertLessEqual(rc.cached, cache_size)
+            calls.append(rc.calls)
+
+        # a larger cache never takes more recursive calls
+        self.assertTrue(calls[0] >= calls[1] >= calls[2])
+        self.assertAlmostEqual(rc.probability(evidence), BNReasoner(net=bn).probability_of_evidence(evidence))
+
+        # a cache that fits every context is allocated in full
+        full = sum(node.capacity for node in rc._internal_nodes())
+        capacities = [node.capacity for node in rc._internal_nodes()]
+        rc = RecursiveConditioning(bn, order, full)
+        self.assertEqual([node.capacity for node in rc._internal_nodes()], capacities)
+
+
+class TestArithmeticCircuit(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.br = BNReasoner(net='testing/relations.BIFXML')
+        self.circuit = self.br.compile_circuit()
+        self.evidence = pd.DataFrame({'dating': [True, False, True], 'religion': [False, False, True]})
+
+    def test_marginals_match_variable_elimination(self):
+        for _, row in self.evidence.iterrows():
+            self.assertAlmostEqual(self.circuit.probability_of_evidence(row), self.br.probability_of_evidence(row))
+            marginals = self.circuit.marginals(row)
+            for variable in self.br.bn.get_all_variables():
+                np.testing.assert_allclose(marginals[variable].values,
+                                           self.br.posterior_factor([variable], row).values)
+
+    def test_batch(self):
+        np.testing.assert_allclose(self.circuit.batch_probability_of_evidence(self.evidence),
+                                   self.br.batch_probability_of_evidence(self.evidence))
+        posteriors = self.circuit.batch_marginals(self.evidence)
+        self.assertEqual(sorted(posteriors), sorted(self.circuit.variables))
+        self.assertEqual(posteriors['friendship'].shape, (3, 2))
+        np.testing.assert_allclose(posteriors['friendship'],
+                                   self.br.batch_marginal_distributions(['friendship'], self.evidence))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/relations.npz'
+            self.circuit.save(path)
+            circuit = ArithmeticCircuit.load(path)
+        self.assertEqual(circuit.variables, self.circuit.variables)
+        loaded, compiled = circuit.batch_marginals(self.evidence), self.circuit.batch_marginals(self.evidence)
+        for variable in compiled:
+            np.testing.assert_array_equal(loaded[variable], compiled[variable])
+
+    def test_unknown_variable(self):
+        with self.assertRaises(ValueError):
+            self.circuit.probability_of_evidence(pd.Series({'foo': True}))
+
+    def test_state_names(self):
+        br = BNReasoner(net='testing/weather.BIFXML')
+        circuit = br.compile_circuit()
+        evidence = pd.Series({'weather': 'rainy', 'traffic': 'high'})
+        self.assertAlmostEqual(circuit.probability_of_evidence(evidence), br.probability_of_evidence(evidence))
+        np.testing.assert_allclose(circuit.batch_probability_of_evidence(pd.DataFrame({'weather': ['rainy', 2]})),
+                                   [0.2, 0.2])
+        with tempfile.TemporaryDirectory() as directory:
+            circuit.save(directory + '/circuit.npz')
+            self.assertEqual(ArithmeticCircuit.load(directory + '/circuit.npz').states, circuit.states)
+
+        # an index past the states of a variable would otherwise set an indicator of the next variable
+        for value in [3, 'foggy', 1.5]:
+            with self.assertRaises(ValueError):
+                circuit.probability_of_evidence(pd.Series({'weather': value}))
+
+
+class TestInferenceSession(unittest.TestCase):
+
+    def test_incremental_updates(self):
+        br = BNReasoner(net='testing/relations.BIFXML')
+        session = InferenceSession(br)
+        full = session.junction_tree.full_operations
+        self.assertGreater(session.add_evidence('dating', True), 0)
+        session.add_evidence('religion', False)
+        session.retract_evidence('dating')
+        self.assertTrue(all(r['operations'] + r['saved'] == full for r in session.history))
+
+        evidence = pd.Series({'religion': False})
+        for variable, marginal in session.all_marginals().items():
+            expected = br.joint_factor([variable], evidence).normalize()
+            np.testing.assert_allclose(marginal['p'], expected.values)
+
+    def test_unknown_variable(self):
+        session = InferenceSession(BNReasoner(net='testing/dog_problem.BIFXML'))
+        with self.assertRaises(Exception):
+            session.add_evidence('cat-out', True)
+
+
+class TestMostLikelyInstantiations(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.br = BNReasoner(net='testing/dog_problem.BIFXML')
+        self.evidence = pd.Series({'hear-bark': True, 'light-on': False})
+
+    def brute_force(self, query):
+        variables = self.br.bn.get_all_variables()
+        joint = Factor.product([self.br.bn.get_factor(v) for v in variables]).reduce(self.evidence)
+        posterior = joint.sum_out([v for v in joint.variables if v not in query]).normalize()
+        return np.sort(posterior.values.flatten())[::-1]
+
+    def test_map(self):
+        result = self.br.MAP(['family-out', 'bowel-problem'], self.evidence, k=3)
+        self.assertEqual(list(result.columns), ['family-out', 'bowel-problem', 'p'])
+        self.assertEqual(result.loc[0, ['family-out', 'bowel-problem']].tolist(), [True, True])
+        np.testing.assert_allclose(result['p'], self.brute_force(['family-out', 'bowel-problem'])[:3])
+
+    def test_mpe(self):
+        result = self.br.MPE(self.evidence, k=2)
+        self.assertEqual(result.loc[0, ['bowel-problem', 'dog-out', 'family-out']].tolist(), [True, True, True])
+        np.testing.assert_allclose(result['p'], self.brute_force(['bowel-problem', 'dog-out', 'family-out'])[:2])
+
+
+class TestDSeparation(unittest.TestCase):
+
+    def setUp(self) -> None:
+        # the lecture example only has a structure, so this also checks that no CPT is touched
+        self.br = BNReasoner(net=create_lecture_example())
+
+    def test_d_separation(self):
+        self.assertTrue(self.br.d_separation(['Visit to Asia', 'Smoker'], ['Dyspnoea', 'Positive X-ray'],
+                                             ['Tuberculosis or Cancer', 'Bronchitis']))
+        self.assertFalse(self.br.d_separation(['Positive X-ray'], ['Smoker'], ['Lung Cancer', 'Dyspnoea']))
+
+    def test_v_structure(self):
+        self.assertTrue(self.br.d_separation(['Tuberculosis'], ['Lung Cancer'], []))
+        self.assertFalse(self.br.d_separation(['Tuberculosis'], ['Lung Cancer'], ['Dyspnoea']))
+
+    def test_d_separated_set(self):
+        self.assertEqual(self.br.d_separated(['Visit to Asia'], ['Tuberculosis']),
+                         {'Smoker', 'Lung Cancer', 'Tuberculosis or Cancer', 'Bronchitis', 'Positive X-ray',
+                          'Dyspnoea'})
+
+    def test_batch(self):
+        triples = [(['Tuberculosis'], ['Lung Cancer'], []),
+                   (['Tuberculosis'], ['Lung Cancer'], ['Dyspnoea']),
+                   (['Tuberculosis'], ['Smoker'], [])]
+        self.assertEqual(self.br.d_separation_batch(triples), [True, False, True])
+
+
+class TestPrune(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.br = BNReasoner(net='testing/lecture_example.BIFXML')
+
+    def test_prune_shares_unchanged_cpts(self):
+        pruned = self.br.prune(['Wet Grass?'], pd.Series({'Rain?': False, 'Winter?': True}))
+        self.assertEqual(pruned.get_all_variables(), ['Winter?', 'Sprinkler?', 'Rain?', 'Wet Grass?'])
+        self.assertEqual(list(pruned.structure.edges), [('Sprinkler?', 'Wet Grass?')])
+        self.assertIs(pruned.get_cpt('Winter?'), self.br.bn.get_cpt('Winter?'))
+        np.testing.assert_allclose(pruned.get_cpt('Wet Grass?')['p'], [1, 0, 0, 0, 0.1, 0.9, 0, 0])
+
+        # the original network is untouched
+        self.assertEqual(len(self.br.bn.get_all_variables()), 5)
+        self.assertEqual(len(self.br.bn.structure.edges), 5)
+        self.assertEqual(self.br.bn.get_cpt('Wet Grass?')['p'].iloc[2], 0.2)
+
+    def test_prune_repeats_node_pruning(self):
+        pruned = self.br.prune(['Winter?'], pd.Series(dtype=object))
+        self.assertEqual(pruned.get_all_variables(), ['Winter?'])
+
+    def test_view_of_view(self):
+        pruned = self.br.prune(['Wet Grass?'], pd.Series(dtype=object))
+        view = pruned.view()
+        view.del_var('Wet Grass?')
+        self.assertIn('Wet Grass?', pruned.get_all_variables())
+        with self.assertRaises(Exception):
+            view.get_cpt('Wet Grass?')
+
+
+class TestOrdering(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bn = BayesNet()
+        self.bn.load_from_bifxml('testing/lecture_example.BIFXML')
+
+    def test_heuristics(self):
+        variables = ['Winter?', 'Sprinkler?', 'Rain?', 'Wet Grass?', 'Slippery Road?']
+        for method in ['min', 'fill', 'weighted-fill', 'weight']:
+            br = BNReasoner(method, net=self.bn)
+            order, width, size = br.order_with_stats(variables)
+            self.assertEqual(sorted(order), sorted(variables))
+            self.assertEqual((width, size), (2, 8))
+        self.assertEqual(BNReasoner('min', net=self.bn).find_order(variables)[0], 'Slippery Road?')
+
+    def test_find_order_keeps_argument(self):
+        variables = ['Winter?', 'Rain?']
+        BNReasoner(net=self.bn).find_order(variables)
+        self.assertEqual(variables, ['Winter?', 'Rain?'])
+
+    def test_search_order(self):
+        interaction_graph = BNReasoner(net='testing/relations.BIFXML').bn.get_interaction_graph()
+        variables = list(interaction_graph.nodes)
+        order, cost = search_order(interaction_graph, variables, 0.05, seed=0)
+        self.assertEqual(sorted(order), sorted(variables))
+        self.assertEqual(order_cost(interaction_graph, order)[0], cost)
+        for heuristic in ['min', 'fill']:
+            greedy = greedy_order(interaction_graph, variables, heuristic)[0]
+            self.assertLessEqual(cost, order_cost(interaction_graph, greedy)[0])
+
+    def test_search_order_returns_early(self):
+        interaction_graph = self.bn.get_interaction_graph()
+        start = time.perf_counter()
+        self.assertEqual(search_order(interaction_graph, [], 60), ([], 0))
+        self.assertEqual(search_order(interaction_graph, ['Rain?'], 60)[0], ['Rain?'])
+
+        # every order of two variables that are not adjacent reaches the lower bound
+        self.assertEqual(search_order(interaction_graph, ['Winter?', 'Slippery Road?'], 60)[1], 12)
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_searched_orders_are_kept(self):
+        br = BNReasoner(net='testing/relations.BIFXML', order_time_budget=0.2)
+        order = br.find_order(br.bn.get_all_variables())
+        start = time.perf_counter()
+        self.assertEqual(br.find_order(br.bn.get_all_variables()), order)
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+    def test_order_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/orders.json'
+            br = BNReasoner(net='testing/relations.BIFXML', order_time_budget=0.05, order_store=path)
+            order = br.find_order(br.bn.get_all_variables())
+
+            # a later reasoner loads the order without searching
+            later = BNReasoner(net='testing/relations.BIFXML', order_time_budget=60, order_store=path)
+            self.assertEqual(later.find_order(br.bn.get_all_variables()), order)
+
+    def test_unknown_heuristic(self):
+        with self.assertRaises(ValueError):
+            greedy_order(self.bn.get_interaction_graph(), ['Rain?'], 'foo')
+
+
+class TestSampler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.br = BNReasoner(net='testing/dog_problem.BIFXML', seed=0)
+        self.query = ['dog-out', 'family-out']
+        self.evidence = pd.Series({'hear-bark': True, 'light-on': False})
+        self.exact = self.br.joint_factor(self.query, self.evidence).normalize().values.flatten()
+
+    def test_methods(self):
+        for method in Sampler.METHODS:
+            table, drawn = self.br.approximate_marginals(self.query, self.evidence, method, n_samples=20000)
+            self.assertGreaterEqual(drawn, 20000)
+            self.assertAlmostEqual(table['p'].sum(), 1)
+            np.testing.assert_allclose(table['p'], self.exact, atol=5 * table['se'].max() + 1e-3)
+
+    def test_engine(self):
+        br = BNReasoner(net='testing/dog_problem.BIFXML', engine='lw', seed=0)
+        posterior = br.marginal_distributions(self.query, self.evidence)
+        np.testing.assert_allclose(posterior['p'], self.exact, atol=0.02)
+
+    def test_seed(self):
+        first = Sampler(self.br.bn, seed=1).estimate(self.query, self.evidence, 'gibbs', 2000)[0]
+        second = Sampler(self.br.bn, seed=1).estimate(self.query, self.evidence, 'gibbs', 2000)[0]
+        np.testing.assert_array_equal(first.values, second.values)
+
+    def test_target_se(self):
+        table, drawn = self.br.approximate_marginals(self.query, self.evidence, n_samples=10 ** 7, target_se=0.01)
+        self.assertLess(drawn, 10 ** 7)
+        self.assertLessEqual(table['se'].max(), 0.01)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            self.br.approximate_marginals(self.query, self.evidence, 'foo')
+
+    def test_all_samples_rejected(self):
+        bn = random_network(30, seed=0)
+        evidence = pd.Series({'X{}'.format(i): True for i in range(5, 30)})
+        sampler = Sampler(bn, seed=0)
+        with self.assertRaisesRegex(ValueError, "'lw'"):
+            sampler.estimate(['X0'], evidence, 'logic', 1000)
+        self.assertEqual(sampler.estimate(['X0'], evidence, 'lw', 1000)[2], 1000)
+
+
+class TestParallelExecutor(unittest.TestCase):
+
+    def test_matches_serial(self):
+        br = BNReasoner(net='testing/dog_problem.BIFXML')
+        queries = [(['dog-out'], pd.Series({'hear-bark': value, 'light-on': True})) for value in [True, False]]
+        queries += [(['family-out', 'bowel-problem'], pd.Series({'dog-out': True}))] * 3
+
+        with ParallelExecutor(br.bn, processes=2, chunksize=2) as executor:
+            marginals = list(executor.marginal_distributions(queries))
+            explanations = list(executor.MAP(queries, k=2))
+
+        self.assertEqual(len(marginals), len(queries))
+        for (query, evidence), marginal, explanation in zip(queries, marginals, explanations):
+            pd.testing.assert_frame_equal(marginal, br.marginal_distributions(query, evidence))
+            pd.testing.assert_frame_equal(explanation, br.MAP(query, evidence, k=2))
+
+    def test_state_names(self):
+        br = BNReasoner(net='testing/weather.BIFXML')
+        queries = [(['traffic'], pd.Series({'weather': 'rainy'})), (['weather'], pd.Series({'wet-grass': 'true'}))]
+        with ParallelExecutor(br.bn, processes=2) as executor:
+            for (query, evidence), marginal in zip(queries, executor.marginal_distributions(queries)):
+                pd.testing.assert_frame_equal(marginal, br.marginal_distributions(query, evidence))
+            with self.assertRaises(ValueError):
+                list(executor.marginal_distributions([(['traffic'], pd.Series({'weather': 'foggy'}))]))
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bn = random_network(60, max_in_degree=4, window=10, seed=3)
+        self.query = ['X50', 'X51']
+        self.evidence = pd.Series({'X5': True, 'X40': False})
+        self.exact = BNReasoner(net=self.bn)
+
+    def test_plan_predicts_peak(self):
+        br = BNReasoner(net=self.bn, trace=True)
+        plan = br.compile_plan(self.query, self.evidence.index.tolist())
+        br.joint_factor(self.query, self.evidence)
+        self.assertEqual(br.tracer.queries[0]['peak_cells'], plan.peak_cells)
+        self.assertEqual(plan.peak_cells, 2 ** len(plan.widest))
+
+    def test_raise(self):
+        plan = self.exact.compile_plan(self.query, self.evidence.index.tolist(), normalized=True)
+        br = BNReasoner(net=self.bn, memory_budget=plan.peak_cells * 4)
+        with self.assertRaises(MemoryBudgetError) as context:
+            br.marginal_distributions(self.query, self.evidence)
+        self.assertEqual(context.exception.variables, plan.widest)
+        self.assertIn(str(plan.widest), str(context.exception))
+
+        # within the budget nothing changes
+        br = BNReasoner(net=self.bn, memory_budget=plan.peak_cells * 8)
+        pd.testing.assert_frame_equal(br.marginal_distributions(self.query, self.evidence),
+                                      self.exact.marginal_distributions(self.query, self.evidence))
+
+    def test_map(self):
+        br = BNReasoner(net=self.bn, memory_budget=2 ** 5 * 8)
+        with self.assertRaises(MemoryBudgetError):
+            br.MAP(self.query, self.evidence)
+        with self.assertRaises(MemoryBudgetError):
+            br.MPE(self.evidence)
+
+        br = BNReasoner(net=self.bn, memory_budget=2 ** 20 * 8)
+        pd.testing.assert_frame_equal(br.MAP(self.query, self.evidence, k=2),
+                                      self.exact.MAP(self.query, self.evidence, k=2))
+
+    def test_condition(self):
+        budget = 2 ** 5 * 8
+        br = BNReasoner(net=self.bn, memory_budget=budget, on_budget='condition', trace=True)
+        np.testing.assert_allclose(br.joint_factor(self.query, self.evidence).values,
+                                   self.exact.joint_factor(self.query, self.evidence).values)
+        np.testing.assert_allclose(br.posterior_factor(self.query, self.evidence).values,
+                                   self.exact.posterior_factor(self.query, self.evidence).values)
+        self.assertTrue(all(record['peak_bytes'] <= budget for record in br.tracer.queries))
+
+    def test_recursive(self):
+        br = BNReasoner(net=self.bn, memory_budget=2 ** 8 * 8, on_budget='recursive')
+        np.testing.assert_allclose(br.posterior_factor(self.query, self.evidence).values,
+                                   self.exact.posterior_factor(self.query, self.evidence).values)
+        self.assertLessEqual(br.recursive_conditioning().cached, 2 ** 8)
+
+    def test_approximate(self):
+        br = BNReasoner(net=self.bn, memory_budget=2 ** 5 * 8, on_budget='approximate', seed=0)
+        np.testing.assert_allclose(br.posterior_factor(self.query, self.evidence).values,
+                                   self.exact.posterior_factor(self.query, self.evidence).values, atol=0.03)
+
+
+class TestTracer(unittest.TestCase):
+
+    def test_trace(self):
+        br = BNReasoner(net='testing/dog_problem.BIFXML', trace=True)
+        evidence = pd.Series({'hear-bark': True})
+        br.marginal_distributions(['family-out'], evidence)
+        br.marginal_distributions(['family-out'], evidence)
+        br.MPE(evidence)
+
+        first, second, mpe = br.tracer.queries
+        self.assertEqual((first['kind'], first['query'], first['evidence']),
+                         ('posterior', ['family-out'], ['hear-bark']))
+        self.assertEqual(sorted(first['order']), ['bowel-problem', 'dog-out', 'hear-bark'])
+        self.assertEqual(first['plan_cache'], {'hits': 0, 'misses': 1})
+        self.assertEqual(second['plan_cache'], {'hits': 1, 'misses': 0})
+        self.assertEqual(first['operations']['sum_out']['count'], 2)
+        self.assertEqual(first['peak_cells'], 8)
+        self.assertEqual(first['peak_bytes'], 64)
+        self.assertEqual(mpe['kind'], 'MPE')
+        self.assertIn('max_product', mpe['operations'])
+        self.assertIn('peak factor: 8 cells', br.tracer.summary(0))
+
+        # the trace is plain JSON
+        with tempfile.TemporaryDirectory() as directory:
+            br.tracer.write(directory + '/trace.json')
+        self.assertTrue(all(event['query'] in (0, 1, 2) for event in br.tracer.trace()['events']))
+
+    def test_disabled(self):
+        self.assertIsNone(BNReasoner(net='testing/dog_problem.BIFXML').tracer)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_random_network(self):
+        bn = random_network(40, max_in_degree=2, window=4, seed=0)
+        self.assertEqual(len(bn.get_all_variables()), 40)
+        for variable in bn.get_all_variables():
+            parents = list(bn.structure.predecessors(variable))
+            self.assertLessEqual(len(parents), 2)
+            self.assertTrue(all(int(variable[1:]) - int(p[1:]) <= 4 for p in parents))
+            np.testing.assert_allclose(bn.get_factor(variable).values.sum(axis=-1), 1)
+
+        # the window bounds the treewidth
+        _, width, _ = BNReasoner(net=bn).order_with_stats(bn.get_all_variables())
+        self.assertLessEqual(width, 4)
+
+    def test_compare(self):
+        result = {'benchmark': 've', 'nodes': 20, 'max_in_degree': 3, 'window': 5, 'seed': 0, 'seconds': 1.0}
+        baseline = {'results': [result, dict(result, benchmark='map')]}
+        current = {'results': [dict(result, seconds=1.1), dict(result, benchmark='map', seconds=2.0)]}
+        rows = compare(baseline, current, tolerance=0.25)
+        self.assertEqual([r['regression'] for r in rows], [False, True])
 
 
 if __name__ == '__main__':